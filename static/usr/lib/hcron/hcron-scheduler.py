@@ -95,12 +95,30 @@ def dump_signal_handler(num, frame):
         l.append("nrunning (%s)" % tp.get_nrunning())
         l.append("nwaiting (%s)" % tp.get_nwaiting())
         l.append("nworkers (%s)" % tp.get_nworkers())
+        if globs.server.wheel:
+            l.append("nspreading (%s)" % globs.server.wheel.get_nwaiting())
         l.append("\nrunning:")
         l.append("\n".join(["%s" % x for x in tp.runs]))
         open(os.path.join(dumpdir, "threadpool"), "w+").write("\n".join(l))
     except:
         pass
 
+    # reloader
+    try:
+        d = globs.server.reloader.get_stats()
+        l = ["%s (%s)" % (k, v) for k, v in sorted(d.items())]
+        open(os.path.join(dumpdir, "reloader"), "w+").write("\n".join(l))
+    except:
+        pass
+
+    # when_* mask cache
+    try:
+        d = library.get_when_mask_cache_stats()
+        l = ["%s (%s)" % (k, v) for k, v in sorted(d.items())]
+        open(os.path.join(dumpdir, "when_mask_cache"), "w+").write("\n".join(l))
+    except:
+        pass
+
 def reload_signal_handler(num, frame):
     log_message("info", "received signal to reload.")
     signal.signal(num, reload_signal_handler)
@@ -44,11 +44,216 @@ SUBST_SEP_LIST_CRE = re.compile(SUBST_SEP_LIST_RE)
 SUBST_LIST_CRE = re.compile(SUBST_LIST_RE)
 SUBST_SLICE_CRE = re.compile(SUBST_SLICE_RE)
 
+# compiled templates and nodes, keyed on the (sub)value they are
+# compiled from; cleared when full
+SUBST_CACHE_SIZE = 16384
+_select_cache = {}
+_slice_cache = {}
+_subst2_cache = {}
+_template_cache = {}
+
+def _cache_put(cache, key, value):
+    if len(cache) >= SUBST_CACHE_SIZE:
+        cache.clear()
+    cache[key] = value
+    return value
+
+def compile_template(value):
+    """Compile value into a template: a tuple of (literal, node)
+    where node is None or a compiled substitution (see
+    compile_subst2()). The equivalent of
+    hcron_variable_substitution().
+    """
+    template = _template_cache.get(value)
+    if template == None:
+        l = []
+        lastpos = 0
+        while True:
+            startpos, endpos = search_name_select(value, lastpos)
+            if startpos == None:
+                break
+            l.append((value[lastpos:startpos], compile_subst2(value[startpos:endpos])))
+            lastpos = endpos
+        l.append((value[lastpos:], None))
+        template = _cache_put(_template_cache, value, tuple(l))
+    return template
+
+def compile_select(op, substName, substBracket, substSelect, value):
+    """Compile the operation (index-slice or fnmatch-select, with
+    optional count) for the substituted select of a substitution.
+    The equivalent of the select part of
+    hcron_variable_substitution2().
+    """
+    key = (op, substName, substBracket, substSelect, value)
+    node = _select_cache.get(key)
+    if node != None:
+        return node
+
+    def fail(varinfo):
+        return value
+
+    try:
+        sid = SUBST_SEP_LIST_CRE.match(substSelect).groupdict()
+    except:
+        return _cache_put(_select_cache, key, fail)
+
+    substSplitSep = sid.get("split_sep")
+    substJoinSep = sid.get("join_sep")
+    if substSplitSep == None:
+        # special case!
+        splitSepNode = compile_subst2(substName == "HCRON_EVENT_NAME" and "/" or ":")
+    elif substSplitSep == "":
+        splitSepNode = compile_subst2("")
+    else:
+        splitSepNode = compile_subst2(substSplitSep)
+    if substJoinSep == None:
+        joinSepNode = None
+    else:
+        joinSepNode = compile_subst2(substJoinSep)
+    listNode = compile_subst2(sid["list"])
+
+    def select(varinfo):
+        try:
+            nameValue = varinfo.get(substName)
+            substSplitSep = splitSepNode(varinfo)
+            if joinSepNode == None:
+                substJoinSep = substSplitSep
+            else:
+                substJoinSep = joinSepNode(varinfo)
+
+            if substSplitSep == "":
+                nameValues = list(nameValue)
+            else:
+                nameValues = nameValue.split(substSplitSep)
+
+            ll = listNode(varinfo).split(",")
+
+            if substBracket == "[":
+                # indexing
+                for i in range(len(ll)):
+                    start, end, step = compile_slice(compile_subst2(ll[i])(varinfo))
+                    ll[i] = substJoinSep.join(nameValues[start:end:step])
+            else:
+                # matching: substitute, match, flatten
+                ll = [ compile_subst2(x)(varinfo) for x in ll ]
+                ll = [ el for x in ll for el in fnmatch.filter(nameValues, x) ]
+
+            result = substJoinSep.join(ll)
+        except:
+            return value
+
+        try:
+            if op == "#" and nameValue != None:
+                result = str(result.count(substSplitSep)+1)
+        except:
+            pass
+        return result
+
+    return _cache_put(_select_cache, key, select)
+
+def compile_slice(st):
+    """Return (start, end, step) for slice. Raise an exception if
+    invalid.
+    """
+    t = _slice_cache.get(st)
+    if t == None:
+        try:
+            # normalize: empty -> None
+            irl = [ el != "" and el or None for el in SUBST_SLICE_CRE.match(st).groups() ]
+            start, endColon, end, stepColon, step = irl[0:5]
+
+            if step != None:
+                step = int(step)
+            else:
+                step = 1
+            if start != None:
+                start = int(start)
+            if end != None:
+                end = int(end)
+            else:
+                if endColon == None:
+                    if start < 0:
+                        end = start-1
+                        step = -1
+                    else:
+                        end = start+1
+                        step = 1
+            t = (start, end, step)
+        except:
+            t = ()
+        _cache_put(_slice_cache, st, t)
+    if not t:
+        raise Exception("bad slice (%s)" % st)
+    return t
+
+def compile_subst2(value):
+    """Compile value into a node (function of varinfo) performing the
+    lookup, select and count operations of
+    hcron_variable_substitution2(). Parts which depend on substituted
+    values are compiled, and cached, as they are encountered.
+    """
+    node = _subst2_cache.get(value)
+    if node != None:
+        return node
+
+    nid = None
+    if value != None:
+        m = SUBST_NAME_SELECT_CRE.match(value)
+        nid = m and m.groupdict()
+
+    if nid == None:
+        def node(varinfo):
+            return value
+        return _cache_put(_subst2_cache, value, node)
+
+    op = nid.get("op")
+    substName = nid.get("name")
+    substBracket = nid.get("square_bracket") and "[" or (nid.get("curly_bracket") and "{") or None
+
+    if substBracket == None:
+        # lookup (and count)
+        def node(varinfo):
+            nameValue = varinfo.get(substName)
+            if nameValue == None:
+                return value
+            if op == "#":
+                try:
+                    return str(nameValue.count(":")+1)
+                except:
+                    pass
+            return nameValue
+    else:
+        if substBracket == "[":
+            selectNode = compile_subst2(nid.get("square_select", ""))
+        else:
+            selectNode = compile_subst2(nid.get("curly_select", ""))
+
+        def node(varinfo):
+            try:
+                return compile_select(op, substName, substBracket, selectNode(varinfo), value)(varinfo)
+            except:
+                return value
+
+    return _cache_put(_subst2_cache, value, node)
+
+def substitute(value, varinfo):
+    """Perform variable substitution using the compiled template for
+    value. Equivalent to hcron_variable_substitution().
+    """
+    l = []
+    for literal, node in compile_template(value):
+        l.append(literal)
+        if node != None:
+            l.append(node(varinfo))
+    return "".join(l)
+
 def hcron_variable_substitution(value, varinfo, depth=1):
     """Perform variable substitution.
 
     Search for substitutable segments, substitute, repeat. Once a
     substitution is done, that segment is not treated again.
+
+    Reference implementation; see substitute().
     """
     l = []
     lastpos = 0
@@ -226,16 +431,48 @@ def eval_assignments(assignments, varinfo):
     results back to varinfo.
     """
     for name, value in assignments:
-        varinfo[name] = hcron_variable_substitution(value, varinfo)
+        varinfo[name] = substitute(value, varinfo)
 
-def load_assignments(lines):
-    """Load lines with the format name=value into a list of
-    (name, value) tuples.
+def eval_folded_assignments(folded_assignments, varinfo):
+    """Evaluate folded assignments (see fold_assignments()) using the
+    settings in varinfo and storing the results back to varinfo. Only
+    dynamic assignments are substituted.
     """
-    l = []
+    for name, value, dynamic in folded_assignments:
+        if dynamic:
+            varinfo[name] = substitute(value, varinfo)
+        else:
+            varinfo[name] = value
 
-    for line in lines:
-        name, value  = line.split("=", 1)
-        l.append((name.strip(), value.strip()))
+def fold_assignments(assignments, varinfo, is_late_name):
+    """Evaluate assignments as for eval_assignments() and return them
+    as a tuple of (name, value, dynamic).
 
-    return l
+    An assignment is dynamic if it references a late-bound name
+    (according to is_late_name()) or a name last assigned by a dynamic
+    assignment, or if a referenced value could itself be taken as a
+    reference. Otherwise, it evaluates the same every time and value
+    is the result; for dynamic ones, value is left as is.
+    """
+    l = []
+    dynamicnames = {}
+    for name, value in assignments:
+        dynamic = False
+        for m in SUBST_NAME_CRE.finditer(value):
+            refname = m.group("name")
+            refdynamic = dynamicnames.get(refname)
+            if refdynamic == None:
+                refdynamic = is_late_name(refname)
+            refvalue = varinfo.get(refname)
+            if refdynamic or (refvalue != None and SUBST_NAME_CRE.search(refvalue)):
+                dynamic = True
+                break
+
+        result = substitute(value, varinfo)
+        varinfo[name] = result
+        dynamicnames[name] = dynamic
+        if dynamic:
+            l.append((name, value, True))
+        else:
+            l.append((name, result, False))
+    return tuple(l)
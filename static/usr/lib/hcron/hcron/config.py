@@ -0,0 +1,103 @@
+#! /usr/bin/env python2
+#
+# hcron/config.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Classification of hcron.conf changes.
+
+Settings are either hot (applied to the running scheduler) or
+require a restart. Hot settings are taken from the config as they
+are used, except for:
+- those applied with an action (see Server.apply_config())
+- those used when loading events, which require events to be
+  reloaded
+Settings not known to be hot require a restart.
+"""
+
+# settings read from the config on each use
+HOT_CONFIG_KEYS = set([
+    "allow_localhost",
+    "allow_root_events",
+    "catchup_max_age",
+    "catchup_policy",
+    "command_spawn_timeout",
+    "dispatch_spread",
+    "error_on_empty_command",
+    "load_processes",
+    "max_chain_events",
+    "max_email_notifications",
+    "max_hcron_tree_snapshot_size",
+    "max_materialized_events",
+    "max_next_events",
+    "max_queued_jobs",
+    "reload_debounce",
+    "reload_timeout",
+    "reload_workers",
+    "remote_shell_exec",
+    "remote_shell_type",
+    "smtp_server",
+    "snapshot_format",
+    "test_net_delay",
+    "test_net_retry",
+    "test_net_username",
+    "use_event_cache",
+])
+
+# settings applied with an action
+ACTION_CONFIG_KEYS = set([
+    "log_path",
+    "max_activated_events",
+    "use_syslog",
+])
+
+# settings used when loading events
+RELOAD_CONFIG_KEYS = set([
+    "events_base_path",
+    "lazy_event_load",
+    "match_engine",
+    "max_event_file_size",
+    "max_events_per_user",
+    "max_symlinks",
+    "names_to_ignore_regexp",
+])
+
+# settings derived from others when loaded
+DERIVED_CONFIG_KEYS = set([
+    "names_to_ignore_cregexp",
+])
+
+def get_changed_keys(old, new):
+    """Return sorted list of settings differing between old and new
+    config dicts.
+    """
+    l = []
+    for key in set(old).union(new):
+        if key not in DERIVED_CONFIG_KEYS and old.get(key) != new.get(key):
+            l.append(key)
+    return sorted(l)
+
+def get_restart_keys(keys):
+    """Return list of settings in keys which require a restart.
+    """
+    return [key for key in keys
+        if key not in HOT_CONFIG_KEYS
+            and key not in ACTION_CONFIG_KEYS
+            and key not in RELOAD_CONFIG_KEYS]
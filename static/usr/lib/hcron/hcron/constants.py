@@ -27,22 +27,37 @@
 __all__ = [
     "CONFIG_ALLOW_LOCALHOST",
     "CONFIG_ALLOW_ROOT_EVENTS",
+    "CONFIG_CATCHUP_MAX_AGE",
+    "CONFIG_CATCHUP_POLICY",
     "CONFIG_COMMAND_SPAWN_TIMEOUT",
+    "CONFIG_DISPATCH_SPREAD",
     "CONFIG_ERROR_ON_EMPTY_COMMAND",
+    "CONFIG_LAZY_EVENT_LOAD",
+    "CONFIG_LOAD_PROCESSES",
     "CONFIG_LOG_PATH",
+    "CONFIG_MATCH_ENGINE",
     "CONFIG_MAX_ACTIVATED_EVENTS",
     "CONFIG_MAX_CHAIN_EVENTS",
     "CONFIG_MAX_EMAIL_NOTIFICATIONS",
     "CONFIG_MAX_EVENT_FILE_SIZE",
     "CONFIG_MAX_EVENTS_PER_USER",
     "CONFIG_MAX_HCRON_TREE_SNAPSHOT_SIZE",
+    "CONFIG_MAX_MATERIALIZED_EVENTS",
     "CONFIG_MAX_NEXT_EVENTS",
     "CONFIG_MAX_QUEUED_JOBS",
     "CONFIG_MAX_SYMLINKS",
+    "CONFIG_RELOAD_DEBOUNCE",
+    "CONFIG_RELOAD_TIMEOUT",
+    "CONFIG_RELOAD_WORKERS",
     "CONFIG_REMOTE_SHELL_EXEC",
     "CONFIG_REMOTE_SHELL_TYPE",
+    "CONFIG_SCHEDULER_MODE",
+    "CONFIG_SNAPSHOT_FORMAT",
     "CONFIG_TEST_NET_DELAY",
     "CONFIG_TEST_NET_RETRY",
+    "CONFIG_USE_CONTROL_SOCKET",
+    "CONFIG_USE_EVENT_CACHE",
+    "CONFIG_USE_INOTIFY",
     "CONFIG_USE_SYSLOG",
     "CRONTAB_ALIASES_MAP",
     "DOW_NAMES_MAP",
@@ -57,10 +72,12 @@ __all__ = [
     "HCRON_ALLOWED_USERS_DUMP_PATH",
     "HCRON_CONFIG_DUMP_PATH",
     "HCRON_CONFIG_PATH",
+    "HCRON_CONTROL_SOCKET_PATH",
     "HCRON_DOC_EVENT_FIELD_NAMES",
     "HCRON_DOC_INDEX_NAMES",
     "HCRON_DUMPDIR_BASE",
     "HCRON_ETC_PATH",
+    "HCRON_EVENT_CACHE_HOME",
     "HCRON_EVENT_DEFINITION",
     "HCRON_EVENT_FIELD_NAMES_ALL",
     "HCRON_EVENT_FIELD_NAMES_REQUIRED",
@@ -111,6 +128,7 @@ HCRON_LIB_HOME = os.path.join(HCRON_VAR_PATH, "lib/hcron")
 HCRON_ALLOWED_USERS_DUMP_PATH = os.path.join(HCRON_LIB_HOME, "allowed_users.dump")
 HCRON_CONFIG_DUMP_PATH = os.path.join(HCRON_LIB_HOME, "config.dump")
 HCRON_DUMPDIR_BASE = os.path.join(HCRON_LIB_HOME, "dump")
+HCRON_EVENT_CACHE_HOME = os.path.join(HCRON_LIB_HOME, "cache")
 HCRON_EVENT_LISTS_DUMP_DIR = os.path.join(HCRON_LIB_HOME, "event_lists")
 HCRON_EVENTS_SNAPSHOT_HOME = os.path.join(HCRON_LIB_HOME, "events")
 # var/log
@@ -120,6 +138,7 @@ HCRON_SPOOL_HOME = os.path.join(HCRON_VAR_PATH, "spool/hcron")
 HCRON_SIGNAL_DIR = os.path.join(HCRON_SPOOL_HOME, "signal")
 HCRON_ONDEMAND_HOME = os.path.join(HCRON_SPOOL_HOME, "ondemand")
 
+HCRON_CONTROL_SOCKET_PATH = os.path.join(HCRON_VAR_PATH, "run/hcron.sock")
 HCRON_PID_FILE_PATH = os.path.join(HCRON_VAR_PATH, "run/hcron.pid")
 
 HCRON_TREES_HOME = os.path.join(HCRON_LIB_HOME, "trees")
@@ -196,19 +215,34 @@ HCRON_DOC_INDEX_NAMES = [
 
 CONFIG_ALLOW_LOCALHOST = False              # allow_localhost
 CONFIG_ALLOW_ROOT_EVENTS = False            # allow_root_events
+CONFIG_CATCHUP_MAX_AGE = 3600               # catchup_max_age
+CONFIG_CATCHUP_POLICY = "all"               # catchup_policy
 CONFIG_COMMAND_SPAWN_TIMEOUT = 15           # command_spawn_timeout
+CONFIG_DISPATCH_SPREAD = 0                  # dispatch_spread
 CONFIG_ERROR_ON_EMPTY_COMMAND = False       # error_on_empty_command
+CONFIG_LAZY_EVENT_LOAD = False              # lazy_event_load
+CONFIG_LOAD_PROCESSES = 1                   # load_processes
 CONFIG_LOG_PATH = os.path.join(HCRON_LOG_HOME, "hcron.log") # log_path
+CONFIG_MATCH_ENGINE = "index"               # match_engine
 CONFIG_MAX_ACTIVATED_EVENTS = 20            # max_activated_events
 CONFIG_MAX_CHAIN_EVENTS = 5                 # max_chain_events
 CONFIG_MAX_EMAIL_NOTIFICATIONS = 16         # max_email_notifications
 CONFIG_MAX_EVENT_FILE_SIZE = 5000           # max_event_file_size
 CONFIG_MAX_EVENTS_PER_USER = 25             # max_events_per_user
+CONFIG_MAX_MATERIALIZED_EVENTS = 1000       # max_materialized_events
 CONFIG_MAX_NEXT_EVENTS = 8                  # max_next_events
 CONFIG_MAX_QUEUED_JOBS = 100000             # max_queued_jobs
 CONFIG_MAX_SYMLINKS = 8                     # max_symlinks
+CONFIG_RELOAD_DEBOUNCE = 2                  # reload_debounce
+CONFIG_RELOAD_TIMEOUT = 60                  # reload_timeout
+CONFIG_RELOAD_WORKERS = 8                   # reload_workers
 CONFIG_REMOTE_SHELL_EXEC = "/usr/bin/ssh"   # remote_shell_exec
 CONFIG_REMOTE_SHELL_TYPE = "ssh"            # remote_shell_type
+CONFIG_SCHEDULER_MODE = "poll"              # scheduler_mode
+CONFIG_SNAPSHOT_FORMAT = "tar"              # snapshot_format
+CONFIG_USE_CONTROL_SOCKET = True            # use_control_socket
+CONFIG_USE_EVENT_CACHE = True               # use_event_cache
+CONFIG_USE_INOTIFY = True                   # use_inotify
 CONFIG_USE_SYSLOG = False                   # use_syslog
 CONFIG_MAX_HCRON_TREE_SNAPSHOT_SIZE = 2**18 # 256KB
 CONFIG_TEST_NET_DELAY = 1                   # test_net_delay
@@ -0,0 +1,360 @@
+#! /usr/bin/env python2
+#
+# hcron/control.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Control socket of the scheduler.
+
+Clients connect to a unix domain socket and send requests, one JSON
+object per line, each answered by one JSON object per line:
+    {"op": <op>, ...}
+    {"status": "ok", "result": <result>}
+    {"status": "error", "message": <str>}
+
+Callers are identified with SO_PEERCRED and must be allowed hcron
+users; requests apply to the caller's own events (root may name
+another user with "username"). Ops:
+    activate    activate event ("eventname") on demand
+    list        return event information (as dumped)
+    next        return next scheduled time of (normal) events,
+                optionally matching "pattern"
+    reload      request install of the user's snapshot and reload of
+                events (done by the reloader; see Reloader)
+    status      return scheduler status
+
+All connections are served by a single thread polling them. At most
+MAX_CONNECTIONS are served at once, and those idle for
+CONNECTION_IDLE_TIMEOUT seconds are closed.
+"""
+
+# system imports
+import errno
+import fnmatch
+import json
+import os
+import select
+import socket
+import struct
+import time
+
+# app imports
+from hcron import globs
+from hcron.constants import *
+from hcron.library import get_next_datetime, uid2username
+from hcron.logger import *
+
+# not available as socket.SO_PEERCRED on older pythons
+SO_PEERCRED = getattr(socket, "SO_PEERCRED", 17)
+PEERCRED_FORMAT = "3i"
+
+MAX_REQUEST_SIZE = 65536
+MAX_CONNECTIONS = 64
+CONNECTION_IDLE_TIMEOUT = 30
+# seconds to stop accepting after running out of fds
+ACCEPT_BACKOFF = 1
+POLL_TIMEOUT = 1
+USERNAME_CACHE_TTL = 60
+
+# uid -> (username, time looked up)
+_usernames = {}
+
+class ControlException(Exception):
+    pass
+
+class ControlUnavailableException(ControlException):
+    pass
+
+def get_username(uid):
+    """Return username of uid. Lookups are kept for
+    USERNAME_CACHE_TTL seconds so that requests do not each wait on
+    the name service.
+    """
+    now = time.time()
+    t = _usernames.get(uid)
+    if t == None or now-t[1] >= USERNAME_CACHE_TTL:
+        t = _usernames[uid] = (uid2username(uid), now)
+    return t[0]
+
+def op_activate(username, req):
+    eventname = req.get("eventname")
+    if not eventname:
+        raise ControlException("missing eventname")
+    try:
+        globs.server.jobq.put_ondemand(username, eventname, globs.clock.now())
+    except Exception:
+        raise ControlException("cannot get event (%s)" % eventname)
+    return None
+
+def op_list(username, req):
+    el = globs.eventlistlist.get(username)
+    return el and el.get_info() or []
+
+def op_next(username, req):
+    el = globs.eventlistlist.get(username)
+    pattern = req.get("pattern") or "*"
+    now = (globs.clock.now()+MINUTE_DELTA).replace(second=0, microsecond=0)
+    d = {}
+    for name, event in (el and el.events.items() or []):
+        if event.type != "normal" or not fnmatch.fnmatch(name, pattern):
+            continue
+        dt = get_next_datetime(event.masks, now)
+        d[name] = dt and dt.strftime("%Y-%m-%d %H:%M") or None
+    return d
+
+def op_reload(username, req):
+    # installing switches the effective uid: leave it to the reloader
+    globs.server.reloader.put([username], install=True)
+    return None
+
+def op_status(username, req):
+    el = globs.eventlistlist.get(username)
+    tp = globs.server.jobq.tp
+    d = {
+        "fqdn": globs.fqdn,
+        "nevents": el and len(el.events) or 0,
+        "nrunning": tp.get_nrunning(),
+        "nwaiting": tp.get_nwaiting(),
+        "servername": globs.servername,
+        "version": VERSION,
+    }
+    if globs.server.reloader:
+        d["reloader"] = globs.server.reloader.get_stats()
+    return d
+
+OPS = {
+    "activate": op_activate,
+    "list": op_list,
+    "next": op_next,
+    "reload": op_reload,
+    "status": op_status,
+}
+
+def handle_request(line, uid):
+    """Handle request line from user uid and return response dict.
+    """
+    try:
+        try:
+            req = json.loads(line.decode("utf-8"))
+            op = req["op"]
+        except Exception:
+            raise ControlException("bad request")
+
+        username = get_username(uid)
+        if uid == 0 and req.get("username"):
+            username = str(req["username"])
+        if username not in globs.allowfile.get():
+            raise ControlException("not an allowed hcron user (%s)" % username)
+
+        fn = OPS.get(op)
+        if fn == None:
+            raise ControlException("unknown op (%s)" % op)
+        log_message("debug", "control op (%s) uid (%s)" % (op, uid), username=username)
+        return {"status": "ok", "result": fn(username, req)}
+    except ControlException as detail:
+        return {"status": "error", "message": str(detail)}
+    except Exception as detail:
+        log_message("error", "control request failed (%s)." % detail)
+        return {"status": "error", "message": "request failed"}
+
+def request(op, path=None, timeout=10, **kwargs):
+    """Send request to the scheduler and return the result.
+
+    ControlUnavailableException is raised if the scheduler cannot be
+    reached (callers may then fall back to the spool files),
+    ControlException if the request fails.
+    """
+    path = path or HCRON_CONTROL_SOCKET_PATH
+    kwargs["op"] = op
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except Exception as detail:
+            raise ControlUnavailableException("cannot connect to scheduler (%s)" % detail)
+
+        try:
+            sock.sendall((json.dumps(kwargs)+"\n").encode("utf-8"))
+            b = b""
+            while not b.endswith(b"\n"):
+                data = sock.recv(65536)
+                if not data:
+                    break
+                b += data
+            resp = json.loads(b.decode("utf-8"))
+        except Exception as detail:
+            raise ControlException("no response from scheduler (%s)" % detail)
+    finally:
+        sock.close()
+
+    if resp.get("status") != "ok":
+        raise ControlException(resp.get("message", "request failed"))
+    return resp.get("result")
+
+class Connection:
+
+    def __init__(self, sock, uid):
+        self.sock = sock
+        self.uid = uid
+        self.inbuf = b""
+        self.outbuf = b""
+        self.closing = False
+        self.last = time.time()
+
+class ControlServer:
+    """Control socket server.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conns = {}
+
+        try:
+            os.remove(path)
+        except:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        # anyone may connect; callers are checked per request
+        os.chmod(path, 0o666)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+
+        self.poll = select.poll()
+        self.poll.register(self.sock.fileno(), select.POLLIN)
+        self.listening = True
+        self.accept_resume_time = None
+
+    def accept(self):
+        while len(self.conns) < MAX_CONNECTIONS:
+            try:
+                sock, _ = self.sock.accept()
+            except socket.error as detail:
+                if detail.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    return
+                if detail.errno in [errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM]:
+                    # pending connections would be reported at once
+                    # again; leave them until resources are freed
+                    log_message("warning", "cannot accept control connection (%s)." % detail)
+                    self.accept_resume_time = time.time()+ACCEPT_BACKOFF
+                    return
+                raise
+
+            try:
+                creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize(PEERCRED_FORMAT))
+                pid, uid, gid = struct.unpack(PEERCRED_FORMAT, creds)
+                sock.setblocking(False)
+            except Exception:
+                sock.close()
+                continue
+
+            self.conns[sock.fileno()] = Connection(sock, uid)
+            self.poll.register(sock.fileno(), select.POLLIN)
+
+    def close(self, conn):
+        fd = conn.sock.fileno()
+        try:
+            self.poll.unregister(fd)
+        except Exception:
+            pass
+        del self.conns[fd]
+        conn.sock.close()
+
+    def close_idle(self, now):
+        """Close connections idle for CONNECTION_IDLE_TIMEOUT seconds.
+        """
+        for conn in list(self.conns.values()):
+            if now-conn.last >= CONNECTION_IDLE_TIMEOUT:
+                self.close(conn)
+
+    def run(self):
+        """Serve connections.
+        """
+        while True:
+            try:
+                self.update_listening(time.time())
+                for fd, mask in self.poll.poll(POLL_TIMEOUT*1000):
+                    if fd == self.sock.fileno():
+                        self.accept()
+                    else:
+                        conn = self.conns.get(fd)
+                        if conn:
+                            self.service(conn, mask)
+                self.close_idle(time.time())
+            except Exception as detail:
+                log_message("error", "unexpected exception (%s)." % str(detail))
+                time.sleep(ACCEPT_BACKOFF)
+
+    def service(self, conn, mask):
+        """Read requests, handle complete ones, and write responses
+        as the connection allows.
+        """
+        try:
+            if mask & select.POLLIN:
+                data = conn.sock.recv(65536)
+                if data:
+                    conn.inbuf += data
+                    conn.last = time.time()
+                else:
+                    conn.closing = True
+            elif mask & (select.POLLERR|select.POLLHUP|select.POLLNVAL):
+                self.close(conn)
+                return
+
+            while b"\n" in conn.inbuf:
+                line, conn.inbuf = conn.inbuf.split(b"\n", 1)
+                resp = handle_request(line, conn.uid)
+                conn.outbuf += (json.dumps(resp)+"\n").encode("utf-8")
+            if len(conn.inbuf) > MAX_REQUEST_SIZE:
+                conn.outbuf += (json.dumps({"status": "error", "message": "request too large"})+"\n").encode("utf-8")
+                conn.inbuf = b""
+                conn.closing = True
+
+            if conn.outbuf:
+                try:
+                    n = conn.sock.send(conn.outbuf)
+                    conn.outbuf = conn.outbuf[n:]
+                    conn.last = time.time()
+                except socket.error as detail:
+                    if detail.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                        raise
+
+            if conn.closing and not conn.outbuf:
+                self.close(conn)
+            else:
+                self.poll.modify(conn.sock.fileno(), select.POLLIN|(conn.outbuf and select.POLLOUT or 0))
+        except Exception:
+            self.close(conn)
+
+    def update_listening(self, now):
+        """Poll the listening socket only while connections can be
+        accepted: below MAX_CONNECTIONS and not backing off.
+        """
+        if self.accept_resume_time != None and now >= self.accept_resume_time:
+            self.accept_resume_time = None
+        listening = len(self.conns) < MAX_CONNECTIONS and self.accept_resume_time == None
+        if listening != self.listening:
+            if listening:
+                self.poll.register(self.sock.fileno(), select.POLLIN)
+            else:
+                self.poll.unregister(self.sock.fileno())
+            self.listening = listening
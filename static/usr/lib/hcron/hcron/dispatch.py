@@ -0,0 +1,114 @@
+#! /usr/bin/env python2
+#
+# hcron/dispatch.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Spreading of job dispatch within the minute.
+"""
+
+# system imports
+import threading
+import time
+import zlib
+
+# app imports
+from hcron import globs
+from hcron.constants import *
+from hcron.logger import *
+
+# seconds kept between the dispatch time and the expire time of an
+# event to allow for waiting on the job queue
+DISPATCH_EXPIRE_MARGIN = 1
+
+def get_dispatch_offset(event):
+    """Return the dispatch offset (seconds) within the minute for an
+    event. The offset is derived from the user and event names so it
+    is the same from one minute to the next. Events which opt out
+    (dispatch_spread=off) get 0; events with when_expire get an
+    offset below their expire time (less DISPATCH_EXPIRE_MARGIN).
+    """
+    spread = min(globs.config.get("dispatch_spread", CONFIG_DISPATCH_SPREAD), 60)
+    if event.spread_limit != None:
+        spread = min(spread, event.spread_limit-DISPATCH_EXPIRE_MARGIN)
+    if spread <= 1:
+        return 0
+
+    key = ("%s:%s" % (event.username, event.name)).encode("utf-8")
+    return (zlib.crc32(key) & 0xffffffff) % spread
+
+class DispatchWheel:
+    """Timer wheel of one-second slots holding jobs until their
+    dispatch time (less than a minute away), when they are put on
+    the job queue.
+    """
+
+    def __init__(self, jobq, nslots=60):
+        self.jobq = jobq
+        self.lastsec = int(time.time())
+        self.lock = threading.Lock()
+        self.nslots = nslots
+        self.slots = [[] for _ in range(nslots)]
+
+    def add(self, job, offset):
+        """Add job to be dispatched offset seconds after its scheduled
+        time. Jobs already due (e.g., on catch-up) are put on the job
+        queue immediately.
+        """
+        if offset <= 0:
+            self.jobq.put(job)
+            return
+
+        now = time.time()
+        delay = int(time.mktime(job.sched_datetime.timetuple())+offset-now)
+        if delay <= 0:
+            self.jobq.put(job)
+            return
+
+        delay = min(delay, self.nslots-1)
+        with self.lock:
+            self.slots[(int(now)+delay) % self.nslots].append(job)
+
+    def get_nwaiting(self):
+        """Return number of jobs waiting in the wheel.
+        """
+        return sum([len(slot) for slot in self.slots])
+
+    def run(self):
+        """Dispatch jobs as their slots come due.
+        """
+        while True:
+            try:
+                time.sleep(1.0-(time.time() % 1.0))
+                now = int(time.time())
+
+                jobs = []
+                with self.lock:
+                    # at most one full turn of the wheel
+                    for sec in range(max(self.lastsec+1, now-self.nslots+1), now+1):
+                        i = sec % self.nslots
+                        jobs.extend(self.slots[i])
+                        self.slots[i] = []
+                    self.lastsec = now
+
+                for job in jobs:
+                    self.jobq.put(job)
+            except Exception as detail:
+                log_message("error", "unexpected exception (%s)." % str(detail))
@@ -25,30 +25,228 @@
 """
 
 # system imports
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import json
+import multiprocessing
 import os
 import os.path
-import stat
+import sys
 import textwrap
+import threading
 import time
 import traceback
 
 # app imports
-from hcron import globs
-from hcron.assign import eval_assignments, load_assignments
+from hcron import globs, hcrontree
+from hcron.assign import eval_assignments, eval_folded_assignments, fold_assignments
 from hcron.constants import *
+from hcron.eventcache import get_key, load_event_cache, save_event_cache
+from hcron.eventparser import ParseException, parse_contents
 from hcron.execute import remote_execute
 from hcron.hcrontree import HcronTreeCache, create_user_hcron_tree_file, install_hcron_tree_file
-from hcron.library import WHEN_BITMASKS, WHEN_INDEXES, WHEN_MIN_MAX, get_utcoffset, list_st_to_bitmask, time2seconds, uid2username, username2uid
+from hcron.library import WHEN_BITMASKS, WHEN_INDEXES, WHEN_MIN_MAX, WHEN_NAMES, bitmask_to_list, get_datetime_varinfo, get_next_datetime, get_utcoffset, list_st_to_bitmask, time2seconds, uid2username, username2uid
 from hcron.logger import *
+from hcron.maskarray import MaskArray
 from hcron.notify import send_email_notification
 
+try:
+    # python2
+    intern = intern
+except:
+    # python3
+    intern = sys.intern
+
 tw = textwrap.TextWrapper()
 tw.initial_indent = "    "
 tw.subsequent_indent = "    "
 tw.width = 128
 
+# HCRON_* names set the same at load and activate time; all others
+# are late-bound
+EARLY_HCRON_NAMES = set(["HCRON_EVENT_NAME", "HCRON_HOST_NAME", "HCRON_SERVER_NAME"])
+
+# events matching more (hour, minute) slots than this are not indexed
+# but tested every minute
+INDEX_MAX_SLOTS = 60
+
+# seconds to wait for a terminated installer to exit before it is
+# abandoned
+INSTALL_JOIN_TIMEOUT = 5
+
+# hcron tree caches kept to reload event lines and assignments
+TREE_CACHE_MAX_USERS = 8
+
+# (key, hcron tree cache) by user, least recently used first
+_hcron_tree_caches = OrderedDict()
+_hcron_tree_caches_lock = threading.Lock()
+
+# folded assignments of lazily loaded events keyed on
+# event, least recently used first
+_materialized_cache = OrderedDict()
+_materialized_lock = threading.Lock()
+
+# event lists of users, in a loader process (see init_loader())
+_loader_eventlists = {}
+
+def get_hcron_tree_cache(username, path, fresh=False):
+    """Return hcron tree cache for path. One is kept per user (for
+    the TREE_CACHE_MAX_USERS most recently used) for reuse while the
+    path (and names_to_ignore_regexp) is unchanged, unless fresh.
+
+    The mtime of a directory does not change with the files below
+    it, so a cache may be stale; callers finding so ask for a fresh
+    one.
+    """
+    try:
+        st = os.stat(path)
+        key = (path, getattr(st, "st_mtime_ns", st.st_mtime), st.st_size, st.st_ino, globs.config.get("names_to_ignore_regexp"))
+    except:
+        key = None
+
+    if key != None and not fresh:
+        with _hcron_tree_caches_lock:
+            t = _hcron_tree_caches.pop(username, None)
+            if t != None:
+                _hcron_tree_caches[username] = t
+                if t[0] == key:
+                    return t[1]
+
+    names_to_ignore_cregexp = globs.config.get("names_to_ignore_cregexp")
+    ignoreMatchFn = names_to_ignore_cregexp and names_to_ignore_cregexp.match
+    hcron_tree_cache = HcronTreeCache(username, ignoreMatchFn, path)
+
+    if key != None:
+        with _hcron_tree_caches_lock:
+            _hcron_tree_caches.pop(username, None)
+            while len(_hcron_tree_caches) >= TREE_CACHE_MAX_USERS:
+                _hcron_tree_caches.popitem(last=False)
+            _hcron_tree_caches[username] = (key, hcron_tree_cache)
+    return hcron_tree_cache
+
+def get_materialized_assignments(event):
+    """Return folded assignments of a lazily loaded event, loading
+    them again from the event source if not among the
+    max_materialized_events most recently used. Return None if they
+    cannot be loaded or if the event source no longer matches what
+    the event was loaded from (a reload is pending).
+    """
+    with _materialized_lock:
+        t = _materialized_cache.pop(event, None)
+        if t != None:
+            _materialized_cache[event] = t
+            return t
+
+    # load outside of the lock; from a fresh hcron tree cache if the
+    # one kept does not match
+    try:
+        if event.digests == None:
+            return None
+        context = LoadContext(get_hcron_tree_cache(event.username, event.source))
+        if not context.is_unchanged(event.name, event.digests):
+            context = LoadContext(get_hcron_tree_cache(event.username, event.source, fresh=True))
+            if not context.is_unchanged(event.name, event.digests):
+                log_message("info", "event (%s) changed since loaded; reload pending." % event.name, username=event.username)
+                return None
+        ev = Event(event.name, event.username, autoload=False)
+        ev.load(context=context)
+        t = ev.folded_assignments
+    except Exception:
+        t = None
+    if t == None:
+        return None
+
+    with _materialized_lock:
+        _materialized_cache.pop(event, None)
+        max_materialized_events = max(globs.config.get("max_materialized_events", CONFIG_MAX_MATERIALIZED_EVENTS), 1)
+        while len(_materialized_cache) >= max_materialized_events:
+            _materialized_cache.popitem(last=False)
+        _materialized_cache[event] = t
+    return t
+
+def is_late_name(name):
+    """Return True if name is only bound at activate time.
+    """
+    return name.startswith("HCRON_") and name not in EARLY_HCRON_NAMES
+
+def get_digest(st):
+    """Return digest of (event or include) contents; None has its own
+    digest.
+    """
+    if st == None:
+        return None
+    return hashlib.sha1(st.encode("utf-8")).hexdigest()
+
+class LoadContext:
+    """Context for loading events from an hcron tree.
+
+    The tree and the caches valid for a single load are passed
+    explicitly to the loading code rather than through a global so
+    that loads may run concurrently.
+    """
+
+    def __init__(self, hcron_tree_cache):
+        self.hcron_tree_cache = hcron_tree_cache
+        self.include_cache = {}
+        self.processed_include_cache = {}
+        self.path = hcron_tree_cache.path
+
+    def get_event_contents(self, name):
+        return self.hcron_tree_cache.get_event_contents(name)
+
+    def get_event_digest(self, name):
+        """Return digest of event contents. Taken from the snapshot
+        file index if available.
+        """
+        digest = self.hcron_tree_cache.get_digest(os.path.normpath("events/"+name))
+        if digest == None:
+            digest = get_digest(self.get_event_contents(name))
+        return digest
+
+    def get_event_names(self):
+        return self.hcron_tree_cache.get_event_names()
+
+    def get_include(self, include_name):
+        """Return (contents, digest) of include, cached for the
+        duration of the load.
+        """
+        t = self.include_cache.get(include_name)
+        if t == None:
+            st = self.hcron_tree_cache.get_include_contents(include_name)
+            t = self.include_cache[include_name] = (st, get_digest(st))
+        return t
+
+    def get_processed_include(self, include_name, depth):
+        """Return cached (assignments, lines, includes) of include
+        parsed at depth, or None.
+        """
+        return self.processed_include_cache.get((include_name, depth))
+
+    def set_processed_include(self, include_name, depth, assignments, lines, includes):
+        """Cache the parsed assignments and lines, and the
+        (include_name, digest) closure of an include, shared by all
+        events including it at the same depth. All are stored as
+        tuples so that they are never modified in place.
+        """
+        t = self.processed_include_cache[(include_name, depth)] = (tuple(assignments), tuple(lines), tuple(includes))
+        return t
+
+    def is_unchanged(self, name, digests):
+        """Return True if the event and its includes are as recorded
+        in digests, (digest, includes), when loaded.
+        """
+        digest, includes = digests
+        if self.get_event_digest(name) != digest:
+            return False
+        for include_name, include_digest in includes:
+            if self.get_include(include_name)[1] != include_digest:
+                return False
+        return True
+
+    def is_ignored_event(self, name):
+        return self.hcron_tree_cache.is_ignored_event(name)
+
 def get_event(username, eventname):
     """Return event object.
     """
@@ -57,40 +255,199 @@ def get_event(username, eventname):
     except:
         raise Exception("cannot find event (%s) for user (%s)" % (eventname, username))
 
-def reload_events(signalHomeMtime):
+def get_fork_context():
+    """Return multiprocessing context creating processes by fork.
+    Child processes rely on inheriting the state of the scheduler
+    (e.g., globs), which other start methods do not provide.
+    """
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("fork")
+    # python 2: fork only
+    return multiprocessing
+
+def get_signal_files(dirpath):
+    """Return list of (path, uid, mtime) of signal files in dirpath.
+    Files removed meanwhile are skipped.
+    """
+    l = []
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(dirpath):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            l.append((entry.path, st.st_uid, st.st_mtime))
+    else:
+        for filename in os.listdir(dirpath):
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            l.append((path, st.st_uid, st.st_mtime))
+    return l
+
+def init_loader(eventlists):
+    """Set up loader process with the event lists (by user) from
+    which unchanged events are reused.
+
+    The loader is forked from the (multithreaded) scheduler, so it
+    must not take locks which other threads may have held at fork
+    time: logging is disabled and failures are logged by the parent.
+    """
+    global _loader_eventlists
+
+    disable_logger()
+    _loader_eventlists = eventlists
+
+def install_snapshot(username):
+    """Install snapshot file of user. Run in an installer process.
+    """
+    try:
+        install_hcron_tree_file(username, globs.servername)
+    except Exception:
+        sys.exit(1)
+
+def install_snapshots(usernames, fn=None):
+    """Install snapshot files of users, in order, by up to
+    reload_workers installer processes at a time (the effective uid
+    is switched to read each one, so threads cannot be used). An
+    installer still running after reload_timeout seconds is
+    terminated, and abandoned if it does not exit. fn(username) is
+    called as each user is installed.
+
+    Return list of usernames installed.
+    """
+    nworkers = max(globs.config.get("reload_workers", CONFIG_RELOAD_WORKERS), 1)
+    timeout = globs.config.get("reload_timeout", CONFIG_RELOAD_TIMEOUT)
+    ctx = get_fork_context()
+
+    waiting = list(usernames)
+    running = OrderedDict()
+    installed = []
+    while waiting or running:
+        while waiting and len(running) < nworkers:
+            username = waiting.pop(0)
+            p = ctx.Process(target=install_snapshot, args=(username,))
+            p.daemon = True
+            p.start()
+            running[username] = (p, time.time())
+
+        done = False
+        now = time.time()
+        for username, (p, t0) in list(running.items()):
+            if p.is_alive():
+                if now-t0 < timeout:
+                    continue
+                p.terminate()
+                p.join(INSTALL_JOIN_TIMEOUT)
+                log_message("warning", "timed out installing snapshot file for user (%s) after (%ss)." % (username, timeout))
+                if p.is_alive():
+                    log_message("warning", "abandoned installer (pid %s) for user (%s)." % (p.pid, username))
+            else:
+                p.join()
+                if p.exitcode == 0:
+                    installed.append(username)
+                    if fn:
+                        fn(username)
+                else:
+                    log_message("warning", "could not install snapshot file for user (%s)." % username)
+            del running[username]
+            done = True
+
+        if not done:
+            time.sleep(0.01)
+
+    return installed
+
+def load_eventlist(username):
+    """Load event list for user and return (username, dict,
+    elapsed, nreused), where dict is None on failure. Run in a loader
+    process (see init_loader()).
+    """
+    try:
+        t0 = time.time()
+        el = EventList(username, dumptofile=False, previous=_loader_eventlists.get(username))
+        return username, el.to_dict(), time.time()-t0, el.nreused
+    except Exception:
+        return username, None, 0, 0
+
+def reload_events(signalHomeMtime, reloader=None):
     """Reload events for all users whose signal file mtime is <= to
     that of the signal home directory. Any signal files that are
     created subsequently, will be caught in the next pass.
-    """
-    usernames = {}  # to ensure reload only once per user
 
-    for filename in os.listdir(HCRON_SIGNAL_DIR):
-        path = os.path.join(HCRON_SIGNAL_DIR, filename)
-        st = os.stat(path)
-        mtime = st[stat.ST_MTIME]
+    Signal files are grouped per user. Users who signaled within the
+    last reload_debounce seconds are left for a later pass so that a
+    burst of signals results in a single reload. The others are
+    handled in order of their next scheduled event.
 
-        if mtime <= signalHomeMtime:
-            username = uid2username(st[stat.ST_UID])
+    With a reloader, snapshots are installed (see install_snapshots())
+    and events reloaded by the reloader worker; otherwise, here.
 
-            if username not in usernames:
-                try:
-                    install_hcron_tree_file(username, globs.servername)
-                    globs.eventlistlist.reload(username)
-                    usernames[username] = None
-                except Exception:
-                    log_message("warning", "could not install snapshot file for user (%s)." % username)
+    Return the number of seconds after which signal files left for a
+    later pass are due, or None.
+    """
+    debounce = globs.config.get("reload_debounce", CONFIG_RELOAD_DEBOUNCE)
+    now = time.time()
+
+    signals = {}    # uid -> [paths, latest mtime]
+    for path, uid, mtime in get_signal_files(HCRON_SIGNAL_DIR):
+        if int(mtime) <= signalHomeMtime:
+            t = signals.get(uid)
+            if t == None:
+                signals[uid] = [[path], mtime]
+            else:
+                t[0].append(path)
+                t[1] = max(t[1], mtime)
+
+    delay = None
+    usernames = []
+    for uid, (paths, mtime) in signals.items():
+        if now-mtime < debounce:
+            # wait for signals to settle
+            d = min(debounce-(now-mtime), debounce)
+            if delay == None or d < delay:
+                delay = d
+            continue
 
+        try:
+            usernames.append(uid2username(uid))
+        except Exception:
+            log_message("warning", "could not get username for uid (%s) of signal file(s)." % uid)
+
+        for path in paths:
             try:
                 os.remove(path) # remove singles and multiples
             except Exception:
                 log_message("warning", "could not remove signal file (%s)." % path)
 
+    # soonest due first; users without scheduled events last
+    nextdt = (globs.clock.now()+MINUTE_DELTA).replace(second=0, microsecond=0)
+    keys = {}
+    for username in usernames:
+        el = globs.eventlistlist.get(username)
+        dt = el and el.get_next_datetime(nextdt)
+        keys[username] = (dt == None, dt or nextdt)
+    usernames.sort(key=keys.get)
+
+    if reloader:
+        reloader.put(usernames, install=True)
+    else:
+        globs.eventlistlist.reload_users(install_snapshots(usernames))
+
+    return delay
+
 def signal_reload(unload=False):
-    """Signal to reload.
+    """Signal to reload. The scheduler is asked directly over the
+    control socket if possible (True is returned), otherwise through
+    the signal directory, to be picked up at the next interval (False
+    is returned).
 
     This should be called by client only, not server.
     """
     import tempfile
+    from hcron.control import ControlUnavailableException, request
     from hcron.trackablefile import AllowFile
 
     allowfile = AllowFile(HCRON_ALLOW_PATH)
@@ -105,10 +462,17 @@ def signal_reload(unload=False):
     except Exception as detail:
         raise Exception("could not create hcron snapshot file (%s)." % detail)
 
+    try:
+        request("reload")
+        return True
+    except ControlUnavailableException:
+        pass
+
     try:
         tempfile.mkstemp(prefix=username, dir=signalHome)
     except:
         raise Exception("could not signal for reload.")
+    return False
 
 class CannotLoadFileException(Exception):
     pass
@@ -125,12 +489,32 @@ class TemplateEventDefinitionException(Exception):
 class EventListList:
     """Event list list.
 
-    All event lists are keyed on user name.
+    All event lists are keyed on user name. The dict holding them
+    is never modified in place but replaced as a whole, so that
+    readers (e.g., job threads) always see a consistent set of event
+    lists while users are reloaded.
     """
     def __init__(self, usernames):
         log_message("info", "initializing events list.")
+        self.lock = threading.RLock()
+        self.eventlists = {}
         self.load(usernames)
 
+    def add_users(self, usernames, reloader=None):
+        """Add users and load their event lists, by the reloader
+        worker if given. Event lists of other users are kept.
+        """
+        with self.lock:
+            usernames = [username for username in usernames if username not in self.usernames]
+            if usernames:
+                # replaced, not extended, for readers (see test())
+                self.usernames = self.usernames+usernames
+        if usernames:
+            if reloader:
+                reloader.put(usernames)
+            else:
+                self.reload_users(usernames)
+
     def get(self, username):
         return self.eventlists.get(username)
 
@@ -142,24 +526,72 @@ class EventListList:
         t0 = time.time()
         self.eventlists = {}
         self.usernames = usernames
+        if globs.schedqueue:
+            globs.schedqueue.clear()
         total = 0 
 
-        for username in self.usernames:
-            self.reload(username)
+        self.reload_users(self.usernames)
 
     def reload(self, username):
-        if username not in self.usernames:
+        self.reload_users([username])
+
+    def reload_users(self, usernames, reuse=True):
+        """Reload event lists for users. With load_processes > 1,
+        event lists are loaded by a pool of processes and put in
+        place as each one completes.
+
+        Unchanged events of the current event lists are reused if
+        reuse (see EventList.load()); not when settings used to load
+        events have changed.
+        """
+        usernames = [username for username in usernames if username in self.usernames]
+        load_processes = globs.config.get("load_processes", CONFIG_LOAD_PROCESSES)
+
+        if load_processes <= 1 or len(usernames) <= 1:
+            for username in usernames:
+                previous = reuse and self.eventlists.get(username) or None
+                t0 = time.time()
+                el = EventList(username, previous=previous)
+                self.set(username, el, time.time()-t0)
             return
 
-        if username in self.eventlists:
-            self.remove(username)
+        pool = get_fork_context().Pool(min(load_processes, len(usernames)), init_loader, (reuse and self.eventlists or {},))
+        try:
+            for username, d, elapsed, nreused in pool.imap_unordered(load_eventlist, usernames):
+                el = EventList(username, autoload=False)
+                if d != None and el.from_dict(d):
+                    el.nreused = nreused
+                    el.build_index()
+                    el.dump()
+                else:
+                    log_message("warning", "could not load events in loader process.", username=username)
+                    t0 = time.time()
+                    el = EventList(username)
+                    elapsed = time.time()-t0
 
-        t0 = time.time()
-        el = EventList(username)
-        t1 = time.time()
+                self.set(username, el, elapsed)
+        finally:
+            pool.close()
+            pool.join()
 
+    def set(self, username, el, elapsed):
+        """Put event list for user in place, replacing any previous
+        one at once. The event list is dropped if the user was removed
+        meanwhile (see remove_users()).
+        """
         if el:
-            self.eventlists[username] = el
+            with self.lock:
+                if username not in self.usernames:
+                    log_message("info", "discarded events of removed user.", username=username)
+                    return
+                eventlists = dict(self.eventlists)
+                previous = eventlists.get(username)
+                eventlists[username] = el
+                self.eventlists = eventlists
+                if globs.schedqueue:
+                    globs.schedqueue.update_user(username, el)
+            if previous:
+                log_discard_events(username, len(previous.events))
             naccepted = 0
             nrejected = 0
             ntemplates = 0
@@ -172,21 +604,36 @@ class EventListList:
                     if event.type == "template":
                         ntemplates += 1
 
-            log_load_events(username, nevents, naccepted, nrejected, ntemplates, t1-t0)
+            log_load_events(username, nevents, naccepted, nrejected, ntemplates, elapsed, el.nreused)
 
     def remove(self, username):
-        if username in self.eventlists:
-            count = len(self.eventlists[username].events)
+        with self.lock:
+            eventlists = dict(self.eventlists)
+            el = eventlists.pop(username, None)
+            self.eventlists = eventlists
+            if el and globs.schedqueue:
+                globs.schedqueue.remove_user(username)
+        if el:
+            log_discard_events(username, len(el.events))
 
-            log_discard_events(username, count)
-            del self.eventlists[username]
+    def remove_users(self, usernames):
+        """Remove users and discard their event lists. Event lists of
+        other users are kept.
+        """
+        with self.lock:
+            usernames = [username for username in usernames if username in self.usernames]
+            if usernames:
+                self.usernames = [username for username in self.usernames if username not in usernames]
+        for username in usernames:
+            self.remove(username)
 
     def test(self, datemasks, usernames=None):
         events = []
         usernames = usernames or self.usernames
+        eventlists = self.eventlists
 
         for username in usernames:
-            el = self.eventlists.get(username)
+            el = eventlists.get(username)
 
             if el:
                 events.extend(el.test(datemasks))
@@ -199,11 +646,49 @@ class EventList:
     ~/.hcron/<hostName>/events).
     """
 
-    def __init__(self, username, path=None, dumptofile=True):
+    def __init__(self, username, path=None, dumptofile=True, previous=None, autoload=True):
         self.username = username
+        self.digests = {}
         self.events = None
         self.dumptofile = dumptofile
-        self.load(path)
+        self.nreused = 0
+        self.index = {}
+        self.maskarray = None
+        self.residual = []
+        if autoload:
+            self.load(path, previous)
+
+    def build_index(self):
+        """Build time index of (normal) events keyed on (hour, minute).
+        Events with wildcard-heavy hour and minute settings go to the
+        residual list instead and are tested every time.
+        """
+        index = {}
+        residual = []
+
+        if globs.config.get("match_engine", CONFIG_MATCH_ENGINE) == "array":
+            self.index = index
+            self.maskarray = MaskArray(self.events.values())
+            self.residual = residual
+            return
+
+        hour_index = WHEN_INDEXES["when_hour"]
+        minute_index = WHEN_INDEXES["when_minute"]
+        for event in self.events.values():
+            if event.type != "normal":
+                continue
+
+            hours = bitmask_to_list(event.masks[hour_index])
+            minutes = bitmask_to_list(event.masks[minute_index])
+            if len(hours)*len(minutes) > INDEX_MAX_SLOTS:
+                residual.append(event)
+            else:
+                for hour in hours:
+                    for minute in minutes:
+                        index.setdefault((hour, minute), []).append(event)
+
+        self.index = index
+        self.residual = residual
 
     def dump(self, dumpdir=None):
         """Dump event list to a file.
@@ -226,15 +711,7 @@ class EventList:
         try:
             f = None
 
-            l = []
-            for event in self.events.values():
-                d = {
-                    "name": event.name,
-                    "type": event.type,
-                    "reason": event.reason or "",
-                    "status": event.type == "normal" and "accepted" or "rejected",
-                }
-                l.append(d)
+            l = self.get_info()
 
             f = open(path, "w+")
             os.chown(path, username2uid(self.username), 0)
@@ -247,67 +724,223 @@ class EventList:
 
         os.umask(oldumask)
 
+    def from_dict(self, d):
+        """Set compiled events (of the user's hcron tree file) from
+        dict (see to_dict()). Return True on success.
+        """
+        try:
+            # looked up by module, as replaced by hcron run
+            treepath = os.path.realpath(hcrontree.get_hcron_tree_filename(self.username, globs.servername))
+            events = {}
+            digests = {}
+            for name, dd in d["events"].items():
+                name = str(name)
+                event = Event(name, self.username, autoload=False)
+                event.from_dict(dd, treepath)
+                events[name] = event
+            for name, (digest, includes) in d["digests"].items():
+                digests[str(name)] = (digest, tuple([tuple(x) for x in includes]))
+                event = events.get(str(name))
+                if event and event.lazy:
+                    event.digests = digests[str(name)]
+        except Exception:
+            # bad dict
+            return False
+
+        self.events = events
+        self.digests = digests
+        return True
+
     def get(self, name):
         return self.events.get(name)
 
-    def load(self, path=None):
+    def get_info(self):
+        """Return list of event information (as dumped).
+        """
+        l = []
+        for event in self.events.values():
+            ndynamic = len([x for x in event.folded_assignments or () if x[2]])
+            d = {
+                "name": event.name,
+                "type": event.type,
+                "reason": event.reason or "",
+                "status": event.type == "normal" and "accepted" or "rejected",
+                "nfolded": len(event.folded_assignments or ())-ndynamic,
+                "ndynamic": ndynamic,
+                "lazy": event.lazy,
+            }
+            l.append(d)
+        return l
+
+    def get_next_datetime(self, dt):
+        """Return the earliest datetime at or after dt at which one
+        of the (normal) events is scheduled, or None.
+        """
+        nextdt = None
+        for event in self.events.values():
+            if event.type == "normal":
+                # no need to look past the earliest so far
+                dt2 = get_next_datetime(event.masks, dt, nextdt)
+                if dt2 != None:
+                    nextdt = dt2
+        return nextdt
+
+    def load(self, path=None, previous=None):
+        """Load events. Events of a previous event list for the user
+        are reused as-is if neither their contents nor those of their
+        includes have changed.
+
+        When loading from the user's hcron tree file, the compiled
+        events are taken from, or saved to, the event cache.
+        """
         self.events = {}
+        self.digests = {}
+        self.nreused = 0
 
         try:
-            max_events_per_user = globs.config.get("max_events_per_user", CONFIG_MAX_EVENTS_PER_USER)
-            names_to_ignore_cregexp = globs.config.get("names_to_ignore_cregexp")
-            ignoreMatchFn = names_to_ignore_cregexp and names_to_ignore_cregexp.match
+            cachekey = None
+            if path == None and globs.config.get("use_event_cache", CONFIG_USE_EVENT_CACHE):
+                # only for the installed hcron tree file (not, e.g.,
+                # the events directory used by hcron run)
+                treepath = os.path.realpath(hcrontree.get_hcron_tree_filename(self.username, globs.servername))
+                treehome = os.path.realpath(hcrontree.get_hcron_tree_home(self.username, globs.servername))
+                if os.path.dirname(treepath) == treehome:
+                    cachekey = get_key(treepath)
+
+            if not self.load_cached(cachekey):
+                self.load_tree(path, previous)
+                # only save if the tree file did not change while loading
+                if cachekey and get_key(treepath) == cachekey:
+                    d = self.to_dict()
+                    save_event_cache(self.username, cachekey, d["events"], d["digests"])
+        except Exception:
+            log_message("error", "could not load events.")
 
-            # global cache assumes single-threaded load!
-            hcron_tree_cache = globs.hcron_tree_cache = HcronTreeCache(self.username, ignoreMatchFn, path)
-            for name in hcron_tree_cache.get_event_names():
-                try:
-                    if hcron_tree_cache.is_ignored_event(name):
-                        continue
+        self.build_index()
 
-                    event = Event(name, self.username)
-                except Exception:
-                    # bad Event definition
-                    pass
-                    #continue
+        if self.dumptofile:
+            self.dump()
 
-                self.events[name] = event
+    def load_cached(self, cachekey):
+        """Load compiled events from the event cache. Return True on
+        success.
+        """
+        d = load_event_cache(self.username, cachekey)
+        if d == None:
+            return False
+        return self.from_dict(d)
 
-                if len(self.events) >= max_events_per_user:
-                    event.reason = "maximum events reached"
-                    log_message("warning", "reached maximum events allowed (%s)." % max_events_per_user)
+    def load_tree(self, path=None, previous=None):
+        """Load events from hcron tree (file or directory).
+        """
+        max_events_per_user = globs.config.get("max_events_per_user", CONFIG_MAX_EVENTS_PER_USER)
+        names_to_ignore_cregexp = globs.config.get("names_to_ignore_cregexp")
+        ignoreMatchFn = names_to_ignore_cregexp and names_to_ignore_cregexp.match
+        lazy = globs.config.get("lazy_event_load", CONFIG_LAZY_EVENT_LOAD)
 
-        except Exception:
-            log_message("error", "could not load events.")
+        context = LoadContext(HcronTreeCache(self.username, ignoreMatchFn, path))
+        for name in context.get_event_names():
+            try:
+                if context.is_ignored_event(name):
+                    continue
+
+                digest = context.get_event_digest(name)
+                event = previous and previous.get_unchanged(name, digest, context)
+                if event:
+                    self.digests[name] = previous.digests[name]
+                    self.nreused += 1
+                else:
+                    includes = []
+                    event = Event(name, self.username, autoload=False)
+                    event.load(includes=includes, context=context, lazy=lazy)
+                    self.digests[name] = (digest, tuple(includes))
+                if event.lazy:
+                    # pin the contents loaded from (see
+                    # get_materialized_assignments())
+                    event.digests = self.digests[name]
+            except Exception:
+                # bad Event definition
+                continue
 
-        # delete any caches (and references) before moving on with or
-        # without an prior exception!
-        hcron_tree_cache = globs.hcron_tree_cache = None
+            self.events[name] = event
 
-        if self.dumptofile:
-            self.dump()
+            if len(self.events) >= max_events_per_user:
+                if self.nreused and previous.events.get(name) is event:
+                    # still in use by the previous event list
+                    event = self.events[name] = event.copy()
+                event.reason = "maximum events reached"
+                log_message("warning", "reached maximum events allowed (%s)." % max_events_per_user)
+
+    def get_unchanged(self, name, digest, context):
+        """Return event if it and its includes (as found in the load
+        context) are unchanged. Otherwise, return None.
+        """
+        event = self.events.get(name)
+        if event == None or event.reason == "maximum events reached":
+            return None
+
+        olddigest, includes = self.digests.get(name, (None, None))
+        if olddigest != digest:
+            return None
+        for include_name, include_digest in includes:
+            if context.get_include(include_name)[1] != include_digest:
+                return None
+        return event
 
     def print_events(self):
         for name, event in self.events.items():
             print("name (%s) event (%s)" % (name, event))
 
+    def to_dict(self):
+        """Return compiled events as a (JSON-able) dict.
+        """
+        return {
+            "events": dict([(name, event.to_dict()) for name, event in self.events.items()]),
+            "digests": self.digests,
+        }
+
     def test(self, datemasks):
+        """Return events matching datemasks. Only indexed candidates
+        for the (hour, minute) and the residual events are tested.
+        """
+        if self.maskarray != None:
+            return self.maskarray.test(datemasks)
+
+        hour = datemasks[WHEN_INDEXES["when_hour"]].bit_length()-1
+        minute = datemasks[WHEN_INDEXES["when_minute"]].bit_length()-1
+
         events = []
-        for event in self.events.values():
+        for event in self.index.get((hour, minute), []):
+            if event.test(datemasks):
+                events.append(event)
+        for event in self.residual:
             if event.test(datemasks):
                 events.append(event)
         return events
 
-class Event:
+class Event(object):
+    """Event definition.
+
+    Only what is needed for scheduling and activation is kept. The
+    raw and included lines of the event file are not retained but
+    reloaded from the event source on demand (see lines_raw and
+    lines_included). Only the folded form of the assignments is kept
+    (see get_assignments()), and lazily loaded events do not keep it
+    either (see get_folded_assignments()).
+    """
+
+    __slots__ = ("name", "username", "digests", "folded_assignments", "lazy", "masks", "reason", "source", "spread_limit", "type", "when")
+
     def __init__(self, name, username, autoload=True):
         self.name = name
-        self.username = username
-        self.assignments = None
-        self.deleted = False
-        self.lines_raw = None
-        self.lines_included = None
+        self.username = intern(username)
+        self.digests = None
+        self.folded_assignments = None
+        self.lazy = False
         self.masks = None
         self.reason = None
+        self.source = None
+        self.spread_limit = None
         self.type = None
         self.when = None
 
@@ -327,8 +960,12 @@ class Event:
         nexteventname = None
         nexteventtype = None
 
-        # late substitution
-        eval_assignments(self.assignments, varinfo)
+        # late substitution (only what could not be folded at load)
+        folded_assignments = self.get_folded_assignments()
+        if folded_assignments != None:
+            eval_folded_assignments(folded_assignments, varinfo)
+        else:
+            raise Exception("cannot load definition of event (%s)" % self.name)
         #open("/tmp/hc", "a").write("self.name (%s) varinfo (%s)\n" % (self.name, str(varinfo)))
 
         # get event file def
@@ -421,6 +1058,71 @@ class Event:
 
         return nexteventnames, nexteventtype
 
+    def copy(self):
+        """Return shallow copy.
+        """
+        event = Event(self.name, self.username, autoload=False)
+        for name in self.__slots__:
+            setattr(event, name, getattr(self, name))
+        return event
+
+    def from_dict(self, d, source=None):
+        """Set compiled state from dict (see to_dict()).
+        """
+        folded_assignments = d["folded_assignments"]
+        if folded_assignments != None:
+            folded_assignments = tuple([tuple(x) for x in folded_assignments])
+        masks = d["masks"]
+        if masks != None:
+            masks = tuple(masks)
+
+        self.folded_assignments = folded_assignments
+        self.lazy = d.get("lazy", False)
+        self.masks = masks
+        self.reason = intern(str(d["reason"]))
+        self.source = source
+        self.spread_limit = d["spread_limit"]
+        self.type = str(d["type"])
+        self.when = d["when"]
+
+    def get_assignments(self):
+        """Return (name, value) assignments derived from the folded
+        ones: values of static assignments are as substituted at
+        load, those of dynamic ones as defined. None if there are
+        none.
+        """
+        folded_assignments = self.get_folded_assignments()
+        if folded_assignments == None:
+            return None
+        return [(name, value) for name, value, _ in folded_assignments]
+
+    def get_folded_assignments(self):
+        """Return folded assignments (see fold_assignments()). Those
+        of a lazily loaded event are loaded again from the event
+        source, when not recently used.
+        """
+        if self.lazy:
+            return get_materialized_assignments(self)
+        return self.folded_assignments
+
+    def get_lines(self):
+        """Return raw and included lines reloaded from the event
+        source (hcron tree) as (lines_raw, lines_included). Events
+        loaded from a plain file have no source.
+        """
+        if self.source == None:
+            return None, None
+
+        context = LoadContext(get_hcron_tree_cache(self.username, self.source))
+        st = context.get_event_contents(self.name)
+        lines_raw = st.split("\n")
+        lines_included = self.parse(self.name, st, context=context)[1]
+
+        return lines_raw, lines_included
+
+    lines_included = property(lambda self: self.get_lines()[1])
+    lines_raw = property(lambda self: self.get_lines()[0])
+
     def get_name(self):
         return self.name
 
@@ -466,32 +1168,24 @@ class Event:
 
             utcoffset = get_utcoffset()
 
-            activate_datetime = globs.clock.now()
-            activate_datetime_utc = activate_datetime+utcoffset
-            varinfo["HCRON_ACTIVATE_DATETIME"] = activate_datetime.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-            varinfo["HCRON_ACTIVATE_DATETIME_UTC"] = activate_datetime_utc.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-            varinfo["HCRON_ACTIVATE_EPOCHTIME"] = activate_datetime.strftime("%s")
-            varinfo["HCRON_ACTIVATE_EPOCHTIME_UTC"] = activate_datetime_utc.strftime("%s")
-
+            varinfo.update(get_datetime_varinfo("ACTIVATE", globs.clock.now(), utcoffset))
             if job.sched_datetime:
-                sched_datetime = job.sched_datetime
-                sched_datetime_utc = sched_datetime+utcoffset
-                varinfo["HCRON_SCHEDULE_DATETIME"] = sched_datetime.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-                varinfo["HCRON_SCHEDULE_DATETIME_UTC"] = sched_datetime_utc.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-                varinfo["HCRON_SCHEDULE_EPOCHTIME"] = sched_datetime.strftime("%s")
-                varinfo["HCRON_SCHEDULE_EPOCHTIME_UTC"] = sched_datetime_utc.strftime("%s")
-
+                varinfo.update(get_datetime_varinfo("SCHEDULE", job.sched_datetime, utcoffset))
             if job.queue_datetime:
-                queue_datetime = job.queue_datetime
-                queue_datetime_utc = queue_datetime+utcoffset
-                varinfo["HCRON_QUEUE_DATETIME"] = queue_datetime.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-                varinfo["HCRON_QUEUE_DATETIME_UTC"] = queue_datetime_utc.strftime("%Y:%m:%d:%H:%M:%S:%W:%w")
-                varinfo["HCRON_QUEUE_EPOCHTIME"] = queue_datetime.strftime("%s")
-                varinfo["HCRON_QUEUE_EPOCHTIME_UTC"] = queue_datetime_utc.strftime("%s")
+                varinfo.update(get_datetime_varinfo("QUEUE", job.queue_datetime, utcoffset))
 
         return varinfo
 
-    def load(self, path=None):
+    def load(self, path=None, includes=None, context=None, lazy=False):
+        """Load event definition from path, or from the hcron tree of
+        the load context. The names and digests of all included files
+        are added to includes, if provided.
+
+        If lazy, only what is needed for scheduling is kept; the
+        assignments are loaded again when needed (see
+        get_folded_assignments()). Events loaded from path are never
+        lazy.
+        """
         varinfo = self.get_varinfo()
 
         masks = {
@@ -501,31 +1195,33 @@ class Event:
         try:
             try:
                 if path:
-                    lines = open(path).read().split("\n")
+                    st = open(path).read()
                 else:
-                    lines = globs.hcron_tree_cache.get_event_contents(self.name).split("\n")
-                self.lines_raw = lines[:]
-                lines = self.process_lines(lines)
+                    self.source = context.path
+                    st = context.get_event_contents(self.name)
             except:
                 self.reason = "cannot load file"
                 raise CannotLoadFileException("Ignored event file (%s)." % self.name)
 
             try:
-                lines = self.process_includes(self.name, lines)
-                self.lines_included = lines[:]
-            except Exception:
-                self.reason = "cannot process include(s)"
+                assignments = self.parse(self.name, st, includes=includes, context=context)[0]
+            except ParseException as detail:
+                self.reason = str(detail)
+                if detail.reason == "bad definition":
+                    raise BadEventDefinitionException("Ignored event file (%s)." % self.name)
                 raise CannotLoadFileException("Ignored event file (%s)." % self.name)
-
-            try:
-                assignments = load_assignments(lines)
             except Exception:
-                self.reason = "bad definition"
-                raise BadEventDefinitionException("Ignored event file (%s)." % self.name)
+                self.reason = "cannot load file"
+                raise CannotLoadFileException("Ignored event file (%s)." % self.name)
 
             try:
-                # early substitution
-                eval_assignments(assignments, varinfo)
+                if lazy and not path:
+                    # early substitution only; nothing to keep
+                    folded_assignments = None
+                    eval_assignments(assignments, varinfo)
+                else:
+                    # early substitution; fold what will not change
+                    folded_assignments = fold_assignments(assignments, varinfo, is_late_name)
             except Exception:
                 self.reason = "bad variable substitution"
                 raise BadVariableSubstitutionException("Ignored event file (%s)." % self.name)
@@ -535,7 +1231,10 @@ class Event:
             # for non-scheduled events in event chains
             #
             # *** keep until alternate solution ***
-            self.assignments = assignments
+            if lazy and not path:
+                self.lazy = True
+            else:
+                self.folded_assignments = folded_assignments
 
             # template check (this should preced when_* checks)
             if varinfo["template_name"] == self.name.split("/")[-1]:
@@ -553,7 +1252,7 @@ class Event:
                 self.reason = "bad when_* setting"
                 raise BadEventDefinitionException("Ignored event file (%s)." % self.name)
 
-            self.masks = masks
+            self.masks = tuple([masks.get(i, 0) for i in range(len(WHEN_NAMES))])
 
             # full specification check
             for name in HCRON_EVENT_FIELD_NAMES_REQUIRED:
@@ -563,6 +1262,12 @@ class Event:
                     raise BadEventDefinitionException("Ignored event file (%s). Missing field (%s)." % \
                         (self.name, name))
 
+            # dispatch spreading: opt out or stay within when_expire
+            if varinfo.get("dispatch_spread") == "off":
+                self.spread_limit = 0
+            elif varinfo.get("when_expire"):
+                self.spread_limit = time2seconds(varinfo.get("when_expire"))
+
             self.when = "%s %s %s %s %s %s" % \
                 (varinfo.get("when_year"),
                     varinfo.get("when_month"),
@@ -579,48 +1284,64 @@ class Event:
                 self.type = "unknown"
             if self.reason == None:
                 self.reason = "unknown"
+            self.reason = intern(self.reason)
 
-    def process_includes(self, callername, lines, depth=1):
+    def parse(self, name, st, depth=1, includes=None, context=None):
+        """Parse contents of event or include file name and return
+        (assignments, lines) with includes resolved. The names and
+        digests of all included files are added to includes, if
+        provided.
+        """
         if depth > 3:
             raise Exception("Reached include depth maximum (%s)." % depth)
 
-        l = []
-        for line in lines:
-            t = line.split()
-            if len(t) == 2 and t[0] == "include":
-                include_name = self.resolve_event_name_to_name(callername, t[1])
-                lines2 = globs.hcron_tree_cache.get_include_contents(include_name).split("\n")
-                lines2 = self.process_lines(lines2)
-                lines2 = self.process_includes(include_name, lines2, depth+1)
-                l.extend(lines2)
-            else:
-                l.append(line)
+        def includefn(include_name):
+            return self.parse_include(name, include_name, depth, includes, context)
 
-        return l
+        return parse_contents(st, name, context and includefn)
 
-    def process_lines(self, lines):
-        """Line processing:
-        - non-continuation lines, left-stripped, starting with # are
-          discarded
-        - lines ending in \ are concatenated, unconditionally, with
-          the next line resulting in a replacement line
-        - lines stripped to "" are discarded
+    def parse_include(self, callername, name, depth, includes, context):
+        """Return (assignments, lines) of include name (relative to
+        callername) included at depth.
         """
-        l = []
-        while lines:
-            line = lines.pop(0)
-            if line.lstrip().startswith("#"):
-                continue
-            while lines and line.endswith("\\"):
-                line = line[:-1]+lines.pop(0)
-
-            line = line.strip()
-            if line == "":
-                continue
-            l.append(line)
+        include_name = self.resolve_event_name_to_name(callername, name)
+        t = context.get_processed_include(include_name, depth)
+        if t == None:
+            # nested includes resolve relative to include_name, so
+            # the result does not depend on the caller
+            st, digest = context.get_include(include_name)
+            includes2 = [(include_name, digest)]
+            try:
+                if st == None:
+                    raise Exception("Cannot load include (%s)." % include_name)
+                assignments, lines = self.parse(include_name, st, depth+1, includes2, context)
+            except:
+                # keep track of includes, to notice changes, even
+                # when failing
+                if includes != None:
+                    includes.extend(includes2)
+                raise
+            t = context.set_processed_include(include_name, depth, assignments, lines, includes2)
+
+        assignments, lines, includes2 = t
+        if includes != None:
+            includes.extend(includes2)
+        return assignments, lines
+
+    def to_dict(self):
+        """Return compiled state as a (JSON-able) dict. Lines are
+        not included; they are reloaded from the source.
+        """
+        return {
+            "folded_assignments": self.folded_assignments,
+            "lazy": self.lazy,
+            "masks": self.masks,
+            "reason": self.reason,
+            "spread_limit": self.spread_limit,
+            "type": self.type,
+            "when": self.when,
+        }
 
-        return l
-        
     def test(self, datemasks):
         if self.type != "normal":
             return 0
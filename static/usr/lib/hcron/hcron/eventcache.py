@@ -0,0 +1,148 @@
+#! /usr/bin/env python2
+#
+# hcron/eventcache.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Persistent cache of compiled event lists.
+
+The compiled events of a user are stored as JSON under
+HCRON_EVENT_CACHE_HOME. An entry is only valid for the hcron tree
+file (by digest), cache format version, and compilation settings it
+was saved with; anything else (stale, corrupt, unreadable) is
+ignored and the events are loaded the regular way.
+"""
+
+# system imports
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+
+# app imports
+from hcron import globs
+from hcron.constants import *
+from hcron.library import makedirs
+
+EVENT_CACHE_VERSION = 4
+
+def get_config_fingerprint():
+    """Return fingerprint of settings which affect event
+    compilation.
+    """
+    d = {
+        "fqdn": globs.fqdn,
+        "lazy_event_load": globs.config.get("lazy_event_load", CONFIG_LAZY_EVENT_LOAD),
+        "max_event_file_size": globs.config.get("max_event_file_size", CONFIG_MAX_EVENT_FILE_SIZE),
+        "max_events_per_user": globs.config.get("max_events_per_user", CONFIG_MAX_EVENTS_PER_USER),
+        "max_symlinks": globs.config.get("max_symlinks", CONFIG_MAX_SYMLINKS),
+        "names_to_ignore_regexp": globs.config.get("names_to_ignore_regexp"),
+        "servername": globs.servername,
+    }
+    return hashlib.sha1(json.dumps(d, sort_keys=True).encode("utf-8")).hexdigest()
+
+def get_event_cache_filename(username):
+    return os.path.join(HCRON_EVENT_CACHE_HOME, username)
+
+def get_file_digest(path):
+    """Return digest of file contents, or None if it cannot be read.
+    """
+    try:
+        h = hashlib.sha1()
+        f = open(path, "rb")
+        try:
+            while True:
+                b = f.read(65536)
+                if not b:
+                    break
+                h.update(b)
+        finally:
+            f.close()
+        return h.hexdigest()
+    except:
+        return None
+
+def get_key(treepath):
+    """Return cache key for hcron tree file, or None.
+    """
+    digest = get_file_digest(treepath)
+    if digest == None:
+        return None
+    return [EVENT_CACHE_VERSION, get_config_fingerprint(), digest]
+
+def load_event_cache(username, key):
+    """Return cached entry (dict with "events" and "digests") for
+    user if it matches key. Otherwise, return None.
+    """
+    if key == None:
+        return None
+
+    try:
+        f = open(get_event_cache_filename(username), "r")
+        try:
+            d = json.load(f)
+        finally:
+            f.close()
+        if d.get("key") != key \
+            or not isinstance(d.get("events"), dict) \
+            or not isinstance(d.get("digests"), dict):
+            return None
+        return d
+    except:
+        return None
+
+def remove_event_cache(username):
+    try:
+        os.remove(get_event_cache_filename(username))
+    except:
+        pass
+
+def save_event_cache(username, key, events, digests):
+    """Save compiled events (as dicts) and event digests for user
+    under key. The entry is replaced atomically.
+    """
+    if key == None:
+        return
+
+    path = get_event_cache_filename(username)
+    if os.path.dirname(path) != HCRON_EVENT_CACHE_HOME:
+        # paranoia
+        return
+
+    tmppath = None
+    try:
+        makedirs(HCRON_EVENT_CACHE_HOME, 0o700)
+        fd, tmppath = tempfile.mkstemp(prefix=".%s-" % username, dir=HCRON_EVENT_CACHE_HOME)
+        f = os.fdopen(fd, "w")
+        try:
+            json.dump({"key": key, "events": events, "digests": digests}, f)
+        finally:
+            f.close()
+        os.rename(tmppath, path)
+        tmppath = None
+    except:
+        remove_event_cache(username)
+    finally:
+        if tmppath:
+            try:
+                os.remove(tmppath)
+            except:
+                pass
@@ -0,0 +1,102 @@
+#! /usr/bin/env python2
+#
+# hcron/eventparser.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Event definition parser.
+
+Event (and include) file contents are parsed in a single scan, line
+by line, into logical lines and (name, value) assignments:
+- non-continuation lines, left-stripped, starting with # are
+  discarded
+- lines ending in \ are concatenated, unconditionally, with the next
+  line resulting in a replacement line
+- lines stripped to "" are discarded
+- "include <name>" lines are replaced by the contents of the include
+- other lines must have the format name=value
+
+Errors report the source line number at which the logical line
+starts.
+"""
+
+class ParseException(Exception):
+
+    def __init__(self, reason, name, lineno):
+        Exception.__init__(self, "%s (%s:%s)" % (reason, name, lineno))
+        self.reason = reason
+        self.name = name
+        self.lineno = lineno
+
+def parse_contents(st, name, includefn=None):
+    """Parse contents of event or include file name and return
+    (assignments, lines).
+
+    For include lines, includefn(include_name) is called to get the
+    (assignments, lines) of the include, which are spliced in.
+    """
+    assignments = []
+    lines = []
+    rawlines = enumerate(st.split("\n"), 1)
+    for lineno, line in rawlines:
+        if line.endswith("\\"):
+            if line.lstrip().startswith("#"):
+                continue
+            # parts taken together as one line; empty trailing parts
+            # are dropped so that parts[-1] ends the line
+            parts = [line]
+            while parts[-1].endswith("\\"):
+                t = next(rawlines, None)
+                if t == None:
+                    break
+                parts[-1] = parts[-1][:-1]
+                parts.append(t[1])
+                while len(parts) > 1 and not parts[-1]:
+                    parts.pop()
+            line = "".join(parts).strip()
+        else:
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+        if not line:
+            continue
+
+        if line.startswith("include"):
+            t = line.split()
+            if len(t) == 2 and t[0] == "include":
+                if includefn == None:
+                    raise ParseException("cannot process include(s)", name, lineno)
+                try:
+                    assignments2, lines2 = includefn(t[1])
+                except ParseException:
+                    raise
+                except Exception:
+                    raise ParseException("cannot process include(s)", name, lineno)
+                assignments.extend(assignments2)
+                lines.extend(lines2)
+                continue
+
+        name2, sep, value = line.partition("=")
+        if not sep:
+            raise ParseException("bad definition", name, lineno)
+        assignments.append((name2.rstrip(), value.lstrip()))
+        lines.append(line)
+
+    return assignments, lines
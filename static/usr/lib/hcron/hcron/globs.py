@@ -32,10 +32,10 @@ debug = False
 email_notify_enabled = False
 eventlistlist = None
 fqdn = None
-hcron_tree_cache = None
 localhostnames = []
 pidfile = None
 remote_execute_enabled = False
+schedqueue = None
 server = None
 servername = None
 signaldir = None
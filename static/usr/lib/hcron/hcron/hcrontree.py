@@ -25,7 +25,6 @@
 """
 
 # system imports
-from io import BytesIO
 import os
 import os.path
 import shutil
@@ -37,10 +36,15 @@ from hcron import globs
 from hcron.constants import *
 from hcron.library import copyfile, tostr, username2uid
 from hcron.logger import *
+from hcron.snapshot import SnapshotFile, is_snapshot_file, iter_dir_members, write_snapshot_file
 
 class HcronTreeCache:
-    """Interface to packaged hcron tree file containing members, or
-    a directory path, rooted at "events/".
+    """Interface to packaged hcron tree file (indexed snapshot or
+    tar) containing members, or a directory path, rooted at "events/".
+
+    Members are taken in a single streaming pass. File contents of a
+    snapshot file or directory path are only read when asked for, and
+    symlinks are resolved when first needed.
     """
 
     #def __init__(self, path, ignorematchfn=None):
@@ -53,11 +57,37 @@ class HcronTreeCache:
         self.cache = {}
         self.dropped_cache = {}
         self.ignored_cache = {}
+        self.last_read = (None, None)
+        self.link_cache = {}
+        self.names = []
+        self.nonfile_cache = {}
+        self.reader_cache = {}
+        self.resolved_cache = {}
+        self.snapshotfile = None
         self.path = path or os.path.realpath(get_hcron_tree_filename(username, globs.servername))
         self.load()
 
     def get_contents(self, tree_path):
-        return self.cache.get(tree_path)
+        if tree_path in self.cache:
+            return self.cache[tree_path]
+        elif tree_path in self.reader_cache:
+            return self.read_file(tree_path)
+        elif tree_path in self.link_cache:
+            path = self.resolve(tree_path)
+            if path != None:
+                return self.get_contents(path)
+        return None
+
+    def get_digest(self, tree_path):
+        """Return digest of file contents as recorded in the snapshot
+        file index. Otherwise, None.
+        """
+        if self.snapshotfile == None:
+            return None
+        if tree_path in self.link_cache:
+            tree_path = self.resolve(tree_path)
+        m = self.snapshotfile.get_member(tree_path)
+        return m and m["type"] == "file" and m["digest"] or None
 
     def get_event_contents(self, name):
         if name.startswith("/"):
@@ -65,9 +95,16 @@ class HcronTreeCache:
         return None
 
     def get_event_names(self):
+        """Return event names: files, then symlinks resolving to
+        files, in member order.
+        """
         names = []
-        for name in self.cache.keys():
-            if name.startswith("events/"):
+        for name in self.names:
+            if name.startswith("events/") and name not in self.link_cache:
+                names.append(name[6:])
+        for name in self.names:
+            if name.startswith("events/") and name in self.link_cache \
+                and self.is_file(self.resolve(name)):
                 names.append(name[6:])
         return names
 
@@ -83,79 +120,146 @@ class HcronTreeCache:
             return None
 
     def get_names(self):
-        return list(self.cache.keys())
+        return [name for name in self.names if self.is_file(name)]
 
     def is_dropped_event(self, name):
-        return os.path.normpath("event/"+name) in self.dropped_cache
+        name = os.path.normpath("events/"+name)
+        if name in self.link_cache:
+            self.resolve(name)
+        return name in self.dropped_cache
+
+    def is_file(self, name):
+        return name in self.cache or name in self.reader_cache \
+            or (name in self.link_cache and self.is_file(self.resolve(name)))
 
     def is_ignored_event(self, name):
-        return os.path.normpath("events/"+name) in self.ignored_cache
+        # members of ignored directories may not have been visited
+        name = os.path.normpath("events/"+name)
+        while name not in ["", "/"]:
+            if name in self.ignored_cache:
+                return True
+            name = os.path.dirname(name)
+        return False
+
+    def iter_dir_members(self):
+        """Iterate over (name, type, valuefn) for members of a
+        directory path. Directories ignored by the consumer are not
+        descended into.
+        """
+        def reader(path):
+            def read():
+                f = open(path, "rb")
+                try:
+                    return tostr(f.read())
+                finally:
+                    f.close()
+            return read
+
+        for name, typ, path in iter_dir_members(self.path, "events", self.ignored_cache.__contains__):
+            if typ == "link":
+                yield name, typ, lambda: os.readlink(path)
+            elif typ == "file":
+                yield name, "lazyfile", lambda: reader(path)
+            else:
+                yield name, typ, None
+
+    def iter_snapshot_members(self):
+        """Iterate over (name, type, valuefn) for members of a
+        snapshot file, from its index.
+        """
+        def reader(m):
+            return lambda: tostr(self.snapshotfile.read(m))
+
+        self.snapshotfile = SnapshotFile(self.path)
+        for m in self.snapshotfile.get_members():
+            if m["type"] == "link":
+                yield m["name"], "link", lambda: m["link"]
+            elif m["type"] == "file":
+                yield m["name"], "lazyfile", lambda: reader(m)
+            else:
+                yield m["name"], "other", None
+
+    def iter_file_members(self):
+        """Iterate over (name, type, valuefn) for members of an hcron
+        tree file. Member data is only available during iteration.
+        """
+        f = tarfile.open(self.path)
+        try:
+            for m in f:
+                if m.issym():
+                    yield m.name, "link", lambda: m.linkname
+                elif m.isfile():
+                    yield m.name, "file", lambda: tostr(f.extractfile(m).read())
+                else:
+                    yield m.name, "other", None
+        finally:
+            f.close()
 
     def load(self):
-        """Load events from hcron tree file:
-        - event files are loaded
-        - symlinks are resolved
-        - dropped are tracked
+        """Load members from hcron tree file or directory:
+        - event files are loaded (tar) or located (snapshot, directory)
+        - symlinks are tracked, to be resolved when needed
         - ignored are tracked
-        - non-file members are discarded
+        - non-file members are tracked, for symlink resolution
         """
         if not os.path.exists(self.path):
             return
 
         if os.path.isdir(self.path) \
             and os.path.basename(self.path) == "events":
-            _f = BytesIO()
-            f = tarfile.open(mode="w", fileobj=_f)
-            f.add(self.path, "events")
-            _f = BytesIO(_f.getvalue())
-            f = tarfile.open(fileobj=_f)
+            members = self.iter_dir_members()
+        elif is_snapshot_file(self.path):
+            members = self.iter_snapshot_members()
         else:
-            f = tarfile.open(self.path)
+            members = self.iter_file_members()
 
-        cache = {}
-        dropped_cache = {}
-        ignored_cache = {}
-        link_cache = {}
-
-        for m in f.getmembers():
-            if m.name.startswith("events/") or m.name == "events":
-                name = os.path.normpath(m.name)
+        for name, typ, valuefn in members:
+            if name.startswith("events/") or name == "events":
+                name = os.path.normpath(name)
                 basename = os.path.basename(name)
                 dirname = os.path.dirname(name)
 
-                if self.ignorematchfn(basename) or dirname in ignored_cache:
-                    ignored_cache[name] = None
+                if self.ignorematchfn(basename) or dirname in self.ignored_cache:
+                    self.ignored_cache[name] = None
+                elif typ == "link":
+                    self.link_cache[name] = valuefn()
+                    self.names.append(name)
+                elif typ == "file":
+                    self.cache[name] = valuefn()
+                    self.names.append(name)
+                elif typ == "lazyfile":
+                    self.reader_cache[name] = valuefn()
+                    self.names.append(name)
                 else:
-                    if m.issym():
-                        link_cache[m.name] = m.linkname
-                    elif m.isfile():
-                        cache[m.name] = tostr(f.extractfile(m).read())
-                    else:
-                        # need to track
-                        cache[m.name] = None
-        f.close()
-
-        # resolve for symlinks
-        newcache = {}
-        for name, linkname in link_cache.items():
-            path = self.resolve_symlink(name, linkname, cache, link_cache)
-            if path in cache:
-                newcache[name] = cache[path]
-            else:
-                dropped_cache[name] = None
+                    self.nonfile_cache[name] = None
 
-        cache.update(newcache)
-
-        # discard non-files
-        for name in list(cache.keys()):
-            if cache[name] == None:
-                del cache[name]
-
-        self.cache = cache
-        self.dropped_cache = dropped_cache
-        self.ignored_cache = ignored_cache
-
-    def resolve_symlink(self, name, linkname, cache, link_cache):
+    def read_file(self, name):
+        """Read file contents for a snapshot or directory path member.
+        The last one read is kept.
+        """
+        # may be shared by threads: use a consistent (name, contents)
+        t = self.last_read
+        if t[0] != name:
+            try:
+                st = self.reader_cache[name]()
+            except:
+                st = None
+            t = self.last_read = (name, st)
+        return t[1]
+
+    def resolve(self, name):
+        """Return fully resolved member name for symlink name, or
+        None if it cannot be resolved (tracked as dropped). The result
+        is kept.
+        """
+        if name not in self.resolved_cache:
+            path = self.resolve_symlink(name, self.link_cache[name])
+            if path == None:
+                self.dropped_cache[name] = None
+            self.resolved_cache[name] = path
+        return self.resolved_cache[name]
+
+    def resolve_symlink(self, name, linkname):
         """Resolve linkname for name.
         """
         def join_symlink(name, linkname):
@@ -175,10 +279,10 @@ class HcronTreeCache:
             for i, comp in enumerate(pathcomps):
                 comps.append(comp)
                 xpath = "/".join(comps)
-                if xpath in cache:
+                if xpath in self.cache or xpath in self.reader_cache or xpath in self.nonfile_cache:
                     continue
-                elif xpath in link_cache:
-                    path = join_symlink(xpath, link_cache[xpath])
+                elif xpath in self.link_cache:
+                    path = join_symlink(xpath, self.link_cache[xpath])
                     if path == None:
                         return None
                     path = os.path.normpath(os.path.join(path, *(pathcomps[i+1:])))
@@ -204,21 +308,25 @@ def create_user_hcron_tree_file(username, hostname, srcpath=None, dstpath=None,
     cwd = os.getcwd()
     f = None
     names = ["events"]
+    snapshot_format = globs.config.get("snapshot_format", CONFIG_SNAPSHOT_FORMAT)
 
     try:
         # temp file
         _, tmppath = tempfile.mkstemp(prefix="hcron-snapshot-", dir="/tmp")
 
-        # create tar
         srcpath = srcpath or get_user_hcron_tree_home(username, hostname)
-        os.chdir(srcpath)
-        f = tarfile.open(tmppath, mode="w:gz")
-        for name in names:
-            try:
-                f.add(name)
-            except:
-                pass
-        f.close()
+        if snapshot_format == "tar":
+            # create tar
+            os.chdir(srcpath)
+            f = tarfile.open(tmppath, mode="w:gz")
+            for name in names:
+                try:
+                    f.add(name)
+                except:
+                    pass
+            f.close()
+        else:
+            write_snapshot_file(srcpath, tmppath, names)
 
         # move into place
         if os.path.exists(dstpath):
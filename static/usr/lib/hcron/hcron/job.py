@@ -40,6 +40,7 @@ from hcron.event import get_event
 from hcron.library import uid2username
 from hcron.logger import *
 from hcron.threadpool import ThreadPool
+from hcron.watcher import Watcher
 
 class Jobid:
     """Job id consisting of <48-bit time><16-bit counter>.
@@ -110,6 +111,9 @@ class JobQueue:
         many iterations.
         """
         clock = Clock()
+        # wake as soon as a request is written; rescan on timeout
+        # regardless (e.g., when polling)
+        watcher = Watcher([HCRON_ONDEMAND_HOME])
 
         while True:
             clock.set(None)
@@ -137,29 +141,16 @@ class JobQueue:
 
                     eventname = eventname.strip()
                     try:
-                        event = get_event(username, eventname)
+                        self.put_ondemand(username, eventname, clock.now())
                     except:
                         log_message("error", "cannot get event (%s) for user (%s)" % (eventname, username))
                         continue
-
-                    job = Job()
-                    job.triggername = "ondemand"
-                    job.triggerorigin = triggerorigin
-                    job.eventname = event.name
-                    job.eventchainnames = event.name
-                    job.queue_datetime = datetime.now()
-                    job.sched_datetime = clock.now()
-                    job.username = username
-                    self.put(job)
-                    log_queue(job.username, job.jobid, job.jobgid, job.pjobid,
-                        job.triggername, job.triggerorigin, job.eventname,
-                        job.eventchainnames, job.sched_datetime, job.queue_datetime)
                 except:
                     log_message("warning", "failed to queue ondemand event (%s)" % eventname)
                 finally:
                     if path:
                         os.remove(path)
-            time.sleep(ENQUEUE_ONDEMAND_DELAY)
+            watcher.wait(ENQUEUE_ONDEMAND_DELAY)
 
     def handle_job(self, job):
         """Handle a single job and queue related/followon chain jobs
@@ -207,7 +198,7 @@ class JobQueue:
                 # problem cases for nextevent
                 if nextevent == None:
                     log_message("error", "chained event (%s) does not exist." % nexteventname, username=event.username)
-                elif nextevent.assignments == None and nextevent.reason not in [ None, "template" ]:
+                elif nextevent.folded_assignments == None and not nextevent.lazy and nextevent.reason not in [ None, "template" ]:
                     log_message("error", "chained event (%s) was rejected (%s)." % (nexteventname, nextevent.reason), username=event.username)
                     nextevent = None
 
@@ -259,3 +250,24 @@ class JobQueue:
             self.tp.add(key, self.handle_job, args=(job,))
         except:
             raise
+
+    def put_ondemand(self, username, eventname, sched_datetime):
+        """Queue job to activate event of user on demand.
+        """
+        event = get_event(username, eventname)
+        if event == None:
+            raise Exception("cannot find event (%s) for user (%s)" % (eventname, username))
+
+        job = Job()
+        job.triggername = "ondemand"
+        job.triggerorigin = "%s@%s" % (username, globs.servername)
+        job.eventname = event.name
+        job.eventchainnames = event.name
+        job.queue_datetime = datetime.now()
+        job.sched_datetime = sched_datetime
+        job.username = username
+        self.put(job)
+        log_queue(job.username, job.jobid, job.jobgid, job.pjobid,
+            job.triggername, job.triggerorigin, job.eventname,
+            job.eventchainnames, job.sched_datetime, job.queue_datetime)
+        return job
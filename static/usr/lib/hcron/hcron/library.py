@@ -25,10 +25,13 @@
 """
 
 # system imports
-from datetime import datetime
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 import os
 import os.path
 import sys
+import threading
+import time
 try:
     from types import StringTypes
 except:
@@ -62,6 +65,29 @@ WHEN_MIN_MAX = {
 
 WHEN_BITMASKS = dict([(key, 2**(mx-mn+1)-1) for key, (mn,mx) in WHEN_MIN_MAX.items() ])
 
+# compiled when_* settings keyed on (setting, minMax, fullBitmask)
+WHEN_MASK_CACHE_SIZE = 8192
+_when_mask_cache = OrderedDict()
+_when_mask_cache_stats = {"hits": 0, "misses": 0}
+_when_mask_cache_lock = threading.Lock()
+
+# HCRON_<name>_* settings keyed on (name, datetime, utcoffset)
+DATETIME_VARINFO_CACHE_SIZE = 1024
+_datetime_varinfo_cache = OrderedDict()
+_datetime_varinfo_lock = threading.Lock()
+
+def bitmask_to_list(mask):
+    """Return list of (0-based) bit positions set in mask.
+    """
+    l = []
+    i = 0
+    while mask:
+        if mask & 1:
+            l.append(i)
+        mask >>= 1
+        i += 1
+    return l
+
 def date_to_bitmasks(*y_m_d_h_m_dow):
     """Mark the bit positions for year, month, day, etc.
     """
@@ -80,7 +106,87 @@ def date_to_bitmasks(*y_m_d_h_m_dow):
         datemasks[i] = 2**(m_d_h_m_dow[i]-1)
     return datemasks
     
+def get_next_datetime(masks, dt, enddt=None):
+    """Return the first datetime (to the minute) at or after dt which
+    matches the when_* masks. None is returned if there is no match
+    within the when_year range or, if given, at or before enddt.
+    """
+    year_mn, year_mx = WHEN_MIN_MAX["when_year"]
+    year_mask, month_mask, day_mask, hour_mask, minute_mask, dow_mask = \
+        [masks[WHEN_INDEXES[name]] for name in WHEN_NAMES]
+
+    if dt.year < year_mn:
+        dt = datetime(year_mn, 1, 1)
+    d = dt.date()
+    hour0, minute0 = dt.hour, dt.minute
+
+    while d.year <= year_mx:
+        if enddt != None and d > enddt.date():
+            return None
+
+        if not year_mask & (1 << (d.year-year_mn)):
+            d = date(d.year+1, 1, 1)
+            hour0, minute0 = 0, 0
+            continue
+
+        if not month_mask & (1 << (d.month-1)):
+            if d.month == 12:
+                d = date(d.year+1, 1, 1)
+            else:
+                d = date(d.year, d.month+1, 1)
+            hour0, minute0 = 0, 0
+            continue
+
+        # hcron: 0=sun - 6=sat; isoweekday: 1=mon = 7=sun
+        if (day_mask & (1 << (d.day-1))) and (dow_mask & (1 << (d.isoweekday() % 7))):
+            for hour in range(hour0, 24):
+                if not hour_mask & (1 << hour):
+                    continue
+                for minute in range(hour == hour0 and minute0 or 0, 60):
+                    if minute_mask & (1 << minute):
+                        nextdt = datetime(d.year, d.month, d.day, hour, minute)
+                        if enddt != None and nextdt > enddt:
+                            return None
+                        return nextdt
+
+        d += timedelta(days=1)
+        hour0, minute0 = 0, 0
+
+    return None
+
+def get_when_mask_cache_stats():
+    """Return when_* mask cache statistics.
+    """
+    with _when_mask_cache_lock:
+        return {
+            "hits": _when_mask_cache_stats["hits"],
+            "misses": _when_mask_cache_stats["misses"],
+            "size": len(_when_mask_cache),
+            "max_size": WHEN_MASK_CACHE_SIZE,
+        }
+
 def list_st_to_bitmask(st, minMax, fullBitmask):
+    """Return bitmask for a when_* setting. Results are cached
+    process-wide so that the same mask (object) is shared by all
+    events using the same setting for a field.
+    """
+    key = (st, minMax, fullBitmask)
+    with _when_mask_cache_lock:
+        mask = _when_mask_cache.get(key)
+        if mask != None:
+            _when_mask_cache_stats["hits"] += 1
+            return mask
+        _when_mask_cache_stats["misses"] += 1
+
+    mask = _list_st_to_bitmask(st, minMax, fullBitmask)
+    with _when_mask_cache_lock:
+        # another thread may have added it meanwhile: share that one
+        mask = _when_mask_cache.setdefault(key, mask)
+        if len(_when_mask_cache) > WHEN_MASK_CACHE_SIZE:
+            _when_mask_cache.popitem(last=False)
+    return mask
+
+def _list_st_to_bitmask(st, minMax, fullBitmask):
     """Using offset allows one to support small, but arbitrary ranges
     as bitmasks. The following is easier to understand for offset==0
     (e.g., hours, minutes, seconds).
@@ -113,10 +219,13 @@ def list_st_to_bitmask(st, minMax, fullBitmask):
                     hi = int(l[1])-offset
             if low < mn or hi > mx:
                 raise Exception("Out of range.")
-            values = range(low, hi+1, step)
 
-            for el in values:
-                mask |= 2**int(el)
+            if step == 1 and low <= hi:
+                # contiguous run of bits
+                mask |= ((1 << (hi-low+1))-1) << low
+            else:
+                for el in range(low, hi+1, step):
+                    mask |= 1 << el
 
         if mask == fullBitmask:
             break
@@ -222,17 +331,46 @@ def get_events_home_snapshot(username):
 
     return path
 
-def get_utcoffset():
-    """Return UTC offset at the time of the call.
+def get_datetime_varinfo(name, dt, utcoffset):
+    """Return HCRON_<name>_* settings for datetime dt. These are
+    cached by (name, dt to the second, utcoffset) since all jobs
+    activated for the same time share them. The returned dictionary
+    must not be modified.
+    """
+    dt = dt.replace(microsecond=0)
+    key = (name, dt, utcoffset)
+
+    with _datetime_varinfo_lock:
+        d = _datetime_varinfo_cache.get(key)
+    if d != None:
+        return d
+
+    dt_utc = dt+utcoffset
+    d = {
+        "HCRON_%s_DATETIME" % name: dt.strftime("%Y:%m:%d:%H:%M:%S:%W:%w"),
+        "HCRON_%s_DATETIME_UTC" % name: dt_utc.strftime("%Y:%m:%d:%H:%M:%S:%W:%w"),
+        "HCRON_%s_EPOCHTIME" % name: dt.strftime("%s"),
+        "HCRON_%s_EPOCHTIME_UTC" % name: dt_utc.strftime("%s"),
+    }
+
+    with _datetime_varinfo_lock:
+        if len(_datetime_varinfo_cache) >= DATETIME_VARINFO_CACHE_SIZE:
+            _datetime_varinfo_cache.popitem(last=False)
+        _datetime_varinfo_cache[key] = d
+    return d
 
-    TODO: Ugly. Fix to do it properly.
+def get_utcoffset():
+    """Return UTC offset (UTC less local time) at the time of the
+    call. It is looked up on each call since timezone transitions
+    need not be on the hour (e.g., Newfoundland).
     """
-    while True:
-        now = datetime.now()
-        utcnow = datetime.utcnow()
-        if now.minute == utcnow.minute:
-            break
-    return utcnow.replace(second=0, microsecond=0)-now.replace(second=0, microsecond=0)
+    t = time.time()
+    gmtoff = getattr(time.localtime(t), "tm_gmtoff", None)
+    if gmtoff != None:
+        return timedelta(seconds=-gmtoff)
+    # no tm_gmtoff under python 2
+    return datetime.utcfromtimestamp(t).replace(second=0, microsecond=0) \
+        -datetime.fromtimestamp(t).replace(second=0, microsecond=0)
 
 def makedirs(path, mode=None):
     """Make dirs upto and including path. Do not complain if
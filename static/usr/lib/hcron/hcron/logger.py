@@ -36,9 +36,13 @@ from hcron.constants import *
 
 # globals
 logger = None
+log_handler = None
 
 def setup_logger():
-    global logger
+    """Set up logging per config. May be called again to replace the
+    handler.
+    """
+    global log_handler, logger
 
     if globs.config.get("use_syslog", CONFIG_USE_SYSLOG):
         handler = logging.SysLogHandler()
@@ -51,10 +55,23 @@ def setup_logger():
         else:
             handler = logging.StreamHandler(sys.stdout)
     logger = logging.getLogger("")
+    if log_handler:
+        logger.removeHandler(log_handler)
+        log_handler.close()
     logger.addHandler(handler)
+    log_handler = handler
     logger.setLevel(logging.INFO)
     log("start-logging")
 
+def disable_logger():
+    """Drop all log entries from now on (e.g., in a forked process,
+    where logging locks held by other threads at fork time would never
+    be released).
+    """
+    global logger
+
+    logger = None
+
 def log(logtype, **kwargs):
     """Add log entry with all fields tagged with the field name.
 
@@ -62,6 +79,9 @@ def log(logtype, **kwargs):
     optional but always output. All other kwargs settings are provided
     in alphabetical order.
     """
+    if logger == None:
+        return
+
     try:
         d = kwargs.copy()
         l = [
@@ -125,8 +145,8 @@ def log_load_allow():
 def log_load_config():
     log("load-config")
 
-def log_load_events(username, nevents, naccepted, nrejected, ntemplates, elapsed):
-    log("load-events", username=username, nevents=nevents, naccepted=naccepted, nrejected=nrejected, ntemplates=ntemplates, elapsed="%f" % elapsed)
+def log_load_events(username, nevents, naccepted, nrejected, ntemplates, elapsed, nreused=0):
+    log("load-events", username=username, nevents=nevents, naccepted=naccepted, nrejected=nrejected, ntemplates=ntemplates, nreused=nreused, elapsed="%f" % elapsed)
 
 def log_message(typ, msg, username=""):
     log("message", username=username, type=typ, message=msg)
@@ -140,6 +160,9 @@ def log_queue(username, jobid, jobgid, pjobid, triggername, triggerorigin, event
         eventname=eventname, eventchain=eventchainnames,
         schedtime=schedtime, queuetime=queuetime)
 
+def log_reload(count, nwaiting, latency):
+    log("reload", count=count, nwaiting=nwaiting, latency="%f" % latency)
+
 def log_sleep(seconds):
     log("sleep", sleeptime=seconds)
 
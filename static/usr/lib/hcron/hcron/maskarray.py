@@ -0,0 +1,96 @@
+#! /usr/bin/env python2
+#
+# hcron/maskarray.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Event masks packed into arrays for matching many events at once.
+"""
+
+# system imports
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# app imports
+from hcron.library import WHEN_INDEXES
+
+# all masks (the widest is when_minute at 60 bits) fit in 64 bits
+try:
+    array("Q")
+    ARRAY_TYPECODE = "Q"
+except ValueError:
+    # python2: unsigned long is 64 bits on LP64 platforms
+    ARRAY_TYPECODE = "L"
+
+# most selective first: narrows candidates early without numpy
+MATCH_ORDER = [WHEN_INDEXES[name] for name in ["when_minute", "when_hour", "when_day", "when_dow", "when_month", "when_year"]]
+
+class MaskArray:
+    """Masks of (normal) events packed into one contiguous array of
+    unsigned 64-bit integers per when_* field. NumPy is used when
+    available; otherwise, the array module is.
+    """
+
+    def __init__(self, events, use_numpy=True):
+        self.events = [event for event in events if event.type == "normal"]
+        self.use_numpy = use_numpy and numpy != None
+
+        fields = []
+        for i in range(len(WHEN_INDEXES)):
+            values = [event.masks[i] for event in self.events]
+            if self.use_numpy:
+                fields.append(numpy.array(values, dtype=numpy.uint64))
+            else:
+                fields.append(array(ARRAY_TYPECODE, values))
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.events)
+
+    def test(self, datemasks):
+        """Return events matching datemasks.
+        """
+        events = self.events
+        fields = self.fields
+
+        if not events:
+            return []
+
+        if self.use_numpy:
+            i = MATCH_ORDER[0]
+            matched = (fields[i] & numpy.uint64(datemasks[i])) != 0
+            for i in MATCH_ORDER[1:]:
+                matched &= (fields[i] & numpy.uint64(datemasks[i])) != 0
+            return [events[j] for j in numpy.nonzero(matched)[0]]
+        else:
+            i = MATCH_ORDER[0]
+            field = fields[i]
+            datemask = datemasks[i]
+            candidates = [j for j in range(len(field)) if field[j] & datemask]
+            for i in MATCH_ORDER[1:]:
+                if not candidates:
+                    break
+                field = fields[i]
+                datemask = datemasks[i]
+                candidates = [j for j in candidates if field[j] & datemask]
+            return [events[j] for j in candidates]
@@ -0,0 +1,133 @@
+#! /usr/bin/env python2
+#
+# hcron/reloader.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Reloading of user event lists off the scheduling loop.
+"""
+
+# system imports
+from collections import OrderedDict
+import threading
+import time
+
+# app imports
+from hcron import globs
+from hcron.event import install_snapshots
+from hcron.logger import *
+
+class Reloader:
+    """Worker reloading the event lists of users on request. The new
+    event list of a user is built completely before being put in
+    place (see EventListList.set()), so scheduling and activation
+    carry on with the old one meanwhile.
+
+    Snapshot files are installed first for requests asking for it, so
+    that it is not done on the scheduling loop (see install_snapshots()).
+    Each of those users is reloaded as soon as installed.
+
+    Requests for a user already waiting are merged.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = OrderedDict()
+        self.nrunning = 0
+        self.nreloads = 0
+        self.latency_last = 0
+        self.latency_max = 0
+        self.latency_total = 0
+
+    def get_nwaiting(self):
+        """Return number of users waiting to be reloaded.
+        """
+        return len(self.pending)
+
+    def get_stats(self):
+        """Return reload statistics. Latency (seconds) is from request
+        to the new event list being in place.
+        """
+        with self.cond:
+            return {
+                "nwaiting": len(self.pending),
+                "nrunning": self.nrunning,
+                "nreloads": self.nreloads,
+                "latency_last": self.latency_last,
+                "latency_max": self.latency_max,
+                "latency_avg": self.nreloads and self.latency_total/self.nreloads or 0,
+            }
+
+    def put(self, usernames, install=False, reuse=True):
+        """Request reload of users, installing their snapshot files
+        first if install. Unchanged events are reused if reuse (see
+        EventListList.reload_users()).
+        """
+        now = time.time()
+        with self.cond:
+            for username in usernames:
+                t = self.pending.get(username)
+                if t == None:
+                    self.pending[username] = (now, install, reuse)
+                else:
+                    self.pending[username] = (t[0], t[1] or install, t[2] and reuse)
+            self.cond.notify()
+
+    def run(self):
+        """Reload users as requested.
+        """
+        while True:
+            try:
+                with self.cond:
+                    while not self.pending:
+                        self.cond.wait()
+                    requests = list(self.pending.items())
+                    self.pending.clear()
+                    self.nrunning = len(requests)
+
+                for install in [False, True]:
+                    for reuse in [True, False]:
+                        usernames = [username for username, (_, install2, reuse2) in requests \
+                            if install2 == install and reuse2 == reuse]
+                        if not usernames:
+                            continue
+                        if install:
+                            # each user as soon as installed
+                            install_snapshots(usernames,
+                                lambda username: globs.eventlistlist.reload_users([username], reuse))
+                        else:
+                            globs.eventlistlist.reload_users(usernames, reuse)
+
+                now = time.time()
+                with self.cond:
+                    for _, (t0, _, _) in requests:
+                        latency = now-t0
+                        self.latency_max = max(self.latency_max, latency)
+                        self.latency_total += latency
+                    # oldest request first
+                    self.latency_last = now-requests[0][1][0]
+                    self.nreloads += len(requests)
+                    self.nrunning = 0
+                    nwaiting = len(self.pending)
+                log_reload(len(requests), nwaiting, self.latency_last)
+            except Exception as detail:
+                with self.cond:
+                    self.nrunning = 0
+                log_message("error", "unexpected exception (%s)." % str(detail))
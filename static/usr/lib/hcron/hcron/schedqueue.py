@@ -0,0 +1,143 @@
+#! /usr/bin/env python2
+#
+# hcron/schedqueue.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Schedule queue of events ordered on their next fire time.
+"""
+
+# system imports
+import heapq
+import threading
+
+# app imports
+from hcron.constants import *
+from hcron.library import get_next_datetime
+
+class ScheduleQueue:
+    """Priority queue (heap) of (normal) events keyed on their next
+    fire time.
+
+    Entries are tagged with the generation of the user's event list
+    at the time they were added. Replacing or removing the events of
+    a user bumps the generation so that older entries are discarded
+    as they surface.
+    """
+
+    def __init__(self, start):
+        self.counter = 0
+        self.counts = {}
+        self.generations = {}
+        self.heap = []
+        self.lock = threading.Lock()
+        self.start = start.replace(second=0, microsecond=0)
+
+    def _compact(self):
+        """Drop stale entries once they dominate the heap.
+        """
+        nlive = sum(self.counts.values())
+        if len(self.heap) > 2*nlive+1024:
+            generations = self.generations
+            self.heap = [t for t in self.heap if generations.get(t[3].username) == t[2]]
+            heapq.heapify(self.heap)
+
+    def _push(self, event, generation, dt):
+        nextdt = get_next_datetime(event.masks, dt)
+        if nextdt != None:
+            self.counter += 1
+            heapq.heappush(self.heap, (nextdt, self.counter, generation, event))
+            return True
+        return False
+
+    def clear(self):
+        """Remove all entries.
+        """
+        with self.lock:
+            for username in self.generations:
+                self.generations[username] += 1
+            self.counts = {}
+            self.heap = []
+
+    def get_next_datetime(self):
+        """Return the earliest fire time, or None.
+        """
+        with self.lock:
+            heap = self.heap
+            generations = self.generations
+            while heap and generations.get(heap[0][3].username) != heap[0][2]:
+                heapq.heappop(heap)
+            return heap and heap[0][0] or None
+
+    def get_nentries(self):
+        """Return number of (live) entries.
+        """
+        return sum(self.counts.values())
+
+    def load(self, eventlistlist):
+        """Load events of all users.
+        """
+        self.clear()
+        for username, el in list(eventlistlist.eventlists.items()):
+            self.update_user(username, el)
+
+    def pop_due(self, now):
+        """Pop all events due at or before now and requeue them at
+        their next fire time. Return list of (event, sched_datetime).
+        """
+        l = []
+        now = now.replace(second=0, microsecond=0)
+        with self.lock:
+            heap = self.heap
+            generations = self.generations
+            while heap and heap[0][0] <= now:
+                dt, _, generation, event = heapq.heappop(heap)
+                if generations.get(event.username) != generation:
+                    continue
+                l.append((event, dt))
+                if not self._push(event, generation, dt+MINUTE_DELTA):
+                    self.counts[event.username] -= 1
+            self.start = now+MINUTE_DELTA
+        return l
+
+    def remove_user(self, username):
+        """Invalidate all entries of a user.
+        """
+        with self.lock:
+            if username in self.generations:
+                self.generations[username] += 1
+                self.counts[username] = 0
+                self._compact()
+
+    def update_user(self, username, eventlist):
+        """Replace the entries of a user with those of eventlist.
+        Fire times are computed starting from the first minute not
+        yet dispatched.
+        """
+        with self.lock:
+            generation = self.generations.get(username, 0)+1
+            self.generations[username] = generation
+            count = 0
+            if eventlist:
+                for event in eventlist.events.values():
+                    if event.type == "normal" and self._push(event, generation, self.start):
+                        count += 1
+            self.counts[username] = count
+            self._compact()
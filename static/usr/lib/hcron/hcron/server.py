@@ -33,16 +33,25 @@ from time import sleep, time
 
 # app imports
 from hcron import globs
+from hcron.config import RELOAD_CONFIG_KEYS, get_changed_keys, get_restart_keys
 from hcron.constants import *
-from hcron.event import EventListList, reload_events
+from hcron.control import ControlServer
+from hcron.dispatch import DispatchWheel, get_dispatch_offset
+from hcron.event import reload_events
 from hcron.job import Job, JobQueue
-from hcron.library import date_to_bitmasks
+from hcron.library import date_to_bitmasks, get_next_datetime
 from hcron.logger import *
+from hcron.reloader import Reloader
+from hcron.schedqueue import ScheduleQueue
 from hcron.trackablefile import ConfigFile
+from hcron.watcher import IN_ATTRIB, IN_CHANGED, Watcher
 
 class Server:
 
     def __init__(self, threads=True):
+        self.check_lock = threading.RLock()
+        # when signal files left for a later pass are due
+        self.signal_recheck_time = None
         self.jobq = JobQueue()
 
         if threads:
@@ -53,17 +62,190 @@ class Server:
             self.odth = threading.Thread(target=self.jobq.enqueue_ondemand_jobs)
             self.odth.daemon = True
             self.odth.start()
+
+            self.wheel = DispatchWheel(self.jobq)
+            self.wheelth = threading.Thread(target=self.wheel.run)
+            self.wheelth.daemon = True
+            self.wheelth.start()
+
+            self.reloader = Reloader()
+            self.reloaderth = threading.Thread(target=self.reloader.run)
+            self.reloaderth.daemon = True
+            self.reloaderth.start()
+
+            # without inotify, files are only checked each minute
+            self.watcher = Watcher(self.get_watched_dirpaths(), IN_CHANGED|IN_ATTRIB)
+            if self.watcher.is_polling():
+                self.watcherth = None
+            else:
+                self.watcherth = threading.Thread(target=self.watch_files)
+                self.watcherth.daemon = True
+                self.watcherth.start()
+
+            self.control = None
+            self.controlth = None
+            if globs.config.get("use_control_socket", CONFIG_USE_CONTROL_SOCKET):
+                try:
+                    self.control = ControlServer(HCRON_CONTROL_SOCKET_PATH)
+                    self.controlth = threading.Thread(target=self.control.run)
+                    self.controlth.daemon = True
+                    self.controlth.start()
+                except Exception as detail:
+                    log_message("warning", "cannot set up control socket (%s) (%s)." % (HCRON_CONTROL_SOCKET_PATH, detail))
         else:
             self.jobqth = None
             self.odth = None
+            self.wheel = None
+            self.wheelth = None
+            self.reloader = None
+            self.reloaderth = None
+            self.watcher = None
+            self.watcherth = None
+            self.control = None
+            self.controlth = None
 
     def __del__(self):
         # will trigger jobqth to exit
         self.jobq = None
 
+    def apply_catchup_policy(self, pairs, now):
+        """Filter (event, sched_datetime) pairs of missed intervals
+        according to the catch-up policy:
+        - all: keep all
+        - latest: keep only the latest per event
+        - cutoff: keep those no older than catchup_max_age seconds
+        """
+        policy = globs.config.get("catchup_policy", CONFIG_CATCHUP_POLICY)
+
+        if policy == "latest":
+            latest = {}
+            for event, sched_datetime in pairs:
+                key = (event.username, event.name)
+                if key not in latest or latest[key][1] < sched_datetime:
+                    latest[key] = (event, sched_datetime)
+            pairs = list(latest.values())
+        elif policy == "cutoff":
+            max_age = globs.config.get("catchup_max_age", CONFIG_CATCHUP_MAX_AGE)
+            cutoff_datetime = now-timedelta(seconds=max_age)
+            pairs = [(event, sched_datetime) for event, sched_datetime in pairs if sched_datetime >= cutoff_datetime]
+
+        return pairs
+
+    def apply_config(self):
+        """Load hcron.conf again and apply changed settings to the
+        running scheduler. Return False, with nothing applied, if
+        some change requires a restart.
+
+        If hcron.conf cannot be loaded (e.g., partly written), the
+        current settings are kept and it is tried again at the next
+        check.
+        """
+        oldconfig = globs.config
+        # loading exits on failure (see ConfigFile.load()), which must
+        # not end the calling thread
+        try:
+            configfile = ConfigFile(globs.configfile.path)
+        except (Exception, SystemExit):
+            log_message("error", "cannot load hcron.conf; keeping current settings.")
+            return True
+        globs.configfile = configfile
+        config = configfile.get()
+
+        keys = get_changed_keys(oldconfig, config)
+        restartkeys = get_restart_keys(keys)
+        if restartkeys:
+            log_message("info", "hcron.conf settings (%s) require restart" % ", ".join(restartkeys))
+            return False
+
+        globs.config = config
+        if keys:
+            log_message("info", "hcron.conf settings (%s) applied" % ", ".join(keys))
+
+        if "log_path" in keys or "use_syslog" in keys:
+            setup_logger()
+        if "max_activated_events" in keys:
+            self.jobq.tp.set_nworkers(max(config.get("max_activated_events", CONFIG_MAX_ACTIVATED_EVENTS), 1))
+
+        # events loaded under the old settings must not be reused
+        usernames = list(globs.eventlistlist.eventlists.keys())
+        if usernames and RELOAD_CONFIG_KEYS.intersection(keys):
+            if self.reloader:
+                self.reloader.put(usernames, reuse=False)
+            else:
+                globs.eventlistlist.reload_users(usernames, reuse=False)
+        return True
+
+    def check_files(self, signaled=False):
+        """Check and update as necessary. If signaled, signal files
+        are looked for even if the signal directory appears unmodified
+        (e.g., modified again within the same second).
+        """
+        with self.check_lock:
+            self._check_files(signaled)
+
+    def _check_files(self, signaled):
+        if globs.configfile.is_modified():
+            log_message("info", "hcron.conf was modified")
+            if not self.apply_config():
+                ### this is a problem if we are behind schedule!!!
+                # restart
+                globs.pidfile.remove()
+                if "--immediate" not in sys.argv:
+                    # do not miss current "now" time
+                    sys.argv.append("--immediate")
+                os.execv(sys.argv[0], sys.argv)
+        if globs.allowfile.is_modified():
+            log_message("info", "hcron.allow was modified")
+            globs.allowfile.load()
+            added, removed = globs.allowfile.get_changes()
+            log_message("info", "hcron.allow users added (%s) removed (%s)" % (len(added), len(removed)))
+            globs.eventlistlist.remove_users(removed)
+            globs.eventlistlist.add_users(added, self.reloader)
+        recheck = self.signal_recheck_time != None and time() >= self.signal_recheck_time
+        if signaled or recheck or globs.signaldir.is_modified():
+            log_message("info", "signalHome was modified")
+            globs.signaldir.load()
+            delay = reload_events(globs.signaldir.get_modified_time(), self.reloader)
+            self.signal_recheck_time = delay != None and time()+delay or None
+
+    def get_watched_dirpaths(self):
+        """Return directories holding the files checked by
+        check_files().
+        """
+        l = []
+        for path in [os.path.dirname(globs.configfile.path), os.path.dirname(globs.allowfile.path), globs.signaldir.path]:
+            if path not in l:
+                l.append(path)
+        return l
+
+    def queue_job(self, event, triggername, triggerorigin, sched_datetime):
+        """Queue job for event. If dispatch spreading is enabled, the
+        job is held in the dispatch wheel until its offset within the
+        minute.
+        """
+        job = Job()
+        job.triggername = triggername
+        job.triggerorigin = triggerorigin
+        job.eventname = event.name
+        job.eventchainnames = event.name
+        job.queue_datetime = datetime.now()
+        job.sched_datetime = sched_datetime
+        job.username = event.username
+        log_queue(job.username, job.jobid, job.jobgid, job.pjobid,
+            job.triggername, job.triggerorigin, job.eventname,
+            job.eventchainnames, job.sched_datetime, job.queue_datetime)
+
+        if self.wheel:
+            self.wheel.add(job, get_dispatch_offset(event))
+        else:
+            self.jobq.put(job)
+
     def run(self, immediate=False):
         """Run scheduling loop.
         """
+        if globs.config.get("scheduler_mode", CONFIG_SCHEDULER_MODE) == "queue":
+            return self.run_queue(immediate)
+
         now = globs.clock.now()
         next = now # special case
         triggerorigin = "hcron-scheduler"
@@ -95,29 +277,83 @@ class Server:
             now = globs.clock.now()
             log_message("info", "scheduling for next interval (%s)" % next)
 
-            #
-            # check and update as necessary
-            #
-            if globs.configfile.is_modified():
-                ### this is a problem if we are behind schedule!!!
-                log_message("info", "hcron.conf was modified")
-                # restart
-                globs.pidfile.remove()
-                if "--immediate" not in sys.argv:
-                    # do not miss current "now" time
-                    sys.argv.append("--immediate")
-                os.execv(sys.argv[0], sys.argv)
-            if globs.allowfile.is_modified():
-                log_message("info", "hcron.allow was modified")
-                globs.allowfile.load()
-                globs.eventlistlist = EventListList(globs.allowfile.get())
-            if globs.signaldir.is_modified():
-                log_message("info", "signalHome was modified")
-                globs.signaldir.load()
-                reload_events(globs.signaldir.get_modified_time())
+            self.check_files()
 
             log_trigger("clock", triggerorigin)
-            self.run_now("clock", triggerorigin, next)
+            nowminute = globs.clock.now().replace(second=0, microsecond=0)
+            if nowminute > next:
+                # catch up on all missed intervals at once
+                self.run_catchup("clock", triggerorigin, next, nowminute)
+                next = nowminute
+            else:
+                self.run_now("clock", triggerorigin, next)
+
+    def run_queue(self, immediate=False):
+        """Run scheduling loop using the schedule queue. Sleep until
+        the earliest fire time (waking each minute to check for
+        changes) and dispatch only the events that are due.
+        """
+        now = globs.clock.now()
+        triggerorigin = "hcron-scheduler"
+
+        if immediate:
+            log_trigger("immediate", triggerorigin)
+            self.run_now("immediate", triggerorigin, now)
+
+        sq = globs.schedqueue = ScheduleQueue(now+MINUTE_DELTA)
+        sq.load(globs.eventlistlist)
+
+        while True:
+            now = globs.clock.now()
+            wakedt = (now+MINUTE_DELTA).replace(second=0, microsecond=0)
+            nextdt = sq.get_next_datetime()
+            if nextdt != None and nextdt < wakedt:
+                wakedt = nextdt
+
+            if wakedt > now:
+                delta = (wakedt-now).seconds+1
+            else:
+                log_message("info", "behind schedule (%s), sheduling immediately" % (wakedt-now))
+                delta = 0
+
+            log_sleep(delta)
+            sleep(delta)
+
+            self.check_files()
+
+            t0 = time()
+            now = globs.clock.now()
+            due = self.apply_catchup_policy(sq.pop_due(now), now.replace(second=0, microsecond=0))
+            if due:
+                log_trigger("clock", triggerorigin)
+                for event, sched_datetime in due:
+                    self.queue_job(event, "clock", triggerorigin, sched_datetime)
+                log_work(len(due), (time()-t0))
+
+    def run_catchup(self, triggername, triggerorigin, start, end):
+        """Queue jobs, in one pass, for all events scheduled during
+        the missed intervals from start to end (inclusive) subject to
+        the catch-up policy.
+        """
+        t0 = time()
+        pairs = []
+        for el in list(globs.eventlistlist.eventlists.values()):
+            for event in el.events.values():
+                if event.type != "normal":
+                    continue
+                sched_datetime = get_next_datetime(event.masks, start, end)
+                while sched_datetime != None:
+                    pairs.append((event, sched_datetime))
+                    sched_datetime = get_next_datetime(event.masks, sched_datetime+MINUTE_DELTA, end)
+
+        npairs = len(pairs)
+        pairs = self.apply_catchup_policy(pairs, end)
+        pairs.sort(key=lambda t: t[1])
+        log_message("info", "catching up from (%s) to (%s), queueing (%s) of (%s) jobs" % (start, end, len(pairs), npairs))
+
+        for event, sched_datetime in pairs:
+            self.queue_job(event, triggername, triggerorigin, sched_datetime)
+        log_work(len(pairs), (time()-t0))
 
     # TODO: should run_now fork so that the child handled the "now"
     # events and the parent returns to wait for the next "now"?
@@ -132,22 +368,37 @@ class Server:
         hcronWeekday = now.isoweekday() % 7
         datemasks = date_to_bitmasks(now.year, now.month, now.day, now.hour, now.minute, hcronWeekday)
         events = globs.eventlistlist.test(datemasks)
-        if events:
-            for event in events:
-                job = Job()
-                job.triggername = triggername
-                job.triggerorigin = triggerorigin
-                job.eventname = event.name
-                job.eventchainnames = event.name
-                job.queue_datetime = datetime.now()
-                job.sched_datetime = now
-                job.username = event.username
-                log_queue(job.username, job.jobid, job.jobgid, job.pjobid,
-                    job.triggername, job.triggerorigin, job.eventname,
-                    job.eventchainnames, job.sched_datetime, job.queue_datetime)
-                self.jobq.put(job)
+        for event in events:
+            self.queue_job(event, triggername, triggerorigin, now)
         log_work(len(events), (time()-t0))
 
+    def watch_files(self):
+        """Check files as soon as the watcher reports changes to
+        them (or signal files left for a later pass are due) rather
+        than waiting for the next minute.
+        """
+        names = [os.path.basename(globs.configfile.path), os.path.basename(globs.allowfile.path)]
+        while True:
+            try:
+                timeout = 60
+                if self.signal_recheck_time != None:
+                    timeout = min(max(self.signal_recheck_time-time(), 0), timeout)
+                changes = self.watcher.wait(timeout)
+                signaled = False
+                checked = False
+                if self.signal_recheck_time != None and time() >= self.signal_recheck_time:
+                    checked = True
+                for dirpath, name in changes:
+                    if dirpath == None or dirpath == globs.signaldir.path:
+                        signaled = True
+                        checked = True
+                    elif name in names:
+                        checked = True
+                if checked:
+                    self.check_files(signaled)
+            except Exception as detail:
+                log_message("error", "unexpected exception (%s)." % str(detail))
+
 def setup(configpath=None):
     """Do general/common setup.
 
@@ -0,0 +1,186 @@
+#! /usr/bin/env python2
+#
+# hcron/snapshot.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Indexed hcron tree snapshot file format.
+
+Layout:
+    magic (8 bytes)
+    index length (8 bytes, big-endian)
+    index (zlib-compressed JSON, utf-8)
+    member data
+
+The index lists the members in tree order (as tarfile would add
+them), each as one of:
+    {"name": <str>, "type": "file", "offset": <int>,
+        "length": <int>, "digest": <str>}
+    {"name": <str>, "type": "link", "link": <str>}
+    {"name": <str>, "type": "other"}
+
+File data is zlib-compressed per member; offset (relative to the
+start of the member data) and length locate the compressed data,
+digest is the sha1 of the uncompressed data. A member can be read,
+and two snapshots compared, without decompressing anything but the
+index.
+"""
+
+# system imports
+import hashlib
+import json
+import mmap
+import os
+import os.path
+import stat
+import struct
+import zlib
+
+SNAPSHOT_MAGIC = b"HCSNAP01"
+SNAPSHOT_HEADER_SIZE = len(SNAPSHOT_MAGIC)+8
+
+class SnapshotFile:
+    """Read access to an indexed snapshot file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        try:
+            header = self.f.read(SNAPSHOT_HEADER_SIZE)
+            if len(header) != SNAPSHOT_HEADER_SIZE or header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise Exception("not a snapshot file (%s)" % path)
+            indexlen = struct.unpack(">Q", header[len(SNAPSHOT_MAGIC):])[0]
+            self.members = json.loads(zlib.decompress(self.f.read(indexlen)).decode("utf-8"))
+            self.dataoffset = SNAPSHOT_HEADER_SIZE+indexlen
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self.f.close()
+            raise
+        self.members_by_name = dict([(m["name"], m) for m in self.members])
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def get_digests(self):
+        """Return digests of file members keyed on name.
+        """
+        return dict([(m["name"], m["digest"]) for m in self.members if m["type"] == "file"])
+
+    def get_member(self, name):
+        return self.members_by_name.get(name)
+
+    def get_members(self):
+        return self.members
+
+    def read(self, member):
+        """Return (uncompressed) data of file member.
+        """
+        offset = self.dataoffset+member["offset"]
+        b = zlib.decompress(self.mm[offset:offset+member["length"]])
+        if hashlib.sha1(b).hexdigest() != member["digest"]:
+            raise Exception("bad digest for member (%s)" % member["name"])
+        return b
+
+def diff_snapshot_files(path1, path2):
+    """Return (added, removed, changed) file member names between two
+    snapshot files.
+    """
+    digests = []
+    for path in [path1, path2]:
+        snapshotfile = SnapshotFile(path)
+        digests.append(snapshotfile.get_digests())
+        snapshotfile.close()
+    digests1, digests2 = digests
+    added = sorted(set(digests2).difference(digests1))
+    removed = sorted(set(digests1).difference(digests2))
+    changed = sorted([name for name in digests1 if name in digests2 and digests1[name] != digests2[name]])
+    return added, removed, changed
+
+def is_snapshot_file(path):
+    try:
+        f = open(path, "rb")
+        try:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+        finally:
+            f.close()
+    except:
+        return False
+
+def iter_dir_members(path, name, prunefn=None):
+    """Iterate over (name, type, path) for members under path, named
+    from name, in the order used by tarfile. Directories for which
+    prunefn(name) is true (checked after being yielded) are not
+    descended into.
+    """
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        yield name, "link", path
+    elif stat.S_ISREG(st.st_mode):
+        yield name, "file", path
+    elif stat.S_ISDIR(st.st_mode):
+        yield name, "other", path
+        if not (prunefn and prunefn(name)):
+            for basename in sorted(os.listdir(path)):
+                for t in iter_dir_members(os.path.join(path, basename), "%s/%s" % (name, basename), prunefn):
+                    yield t
+    else:
+        yield name, "other", path
+
+def write_snapshot_file(srcpath, dstpath, names):
+    """Write snapshot file at dstpath with named members (and those
+    under them) from srcpath. Missing names are skipped.
+    """
+    members = []
+    chunks = []
+    offset = 0
+    for name in names:
+        path = os.path.join(srcpath, name)
+        if not os.path.lexists(path):
+            continue
+        for membername, typ, memberpath in iter_dir_members(path, name):
+            m = {"name": membername, "type": typ}
+            if typ == "link":
+                m["link"] = os.readlink(memberpath)
+            elif typ == "file":
+                f = open(memberpath, "rb")
+                try:
+                    b = f.read()
+                finally:
+                    f.close()
+                cb = zlib.compress(b)
+                m["offset"] = offset
+                m["length"] = len(cb)
+                m["digest"] = hashlib.sha1(b).hexdigest()
+                chunks.append(cb)
+                offset += len(cb)
+            members.append(m)
+
+    index = zlib.compress(json.dumps(members, sort_keys=True).encode("utf-8"))
+    f = open(dstpath, "wb")
+    try:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack(">Q", len(index)))
+        f.write(index)
+        for cb in chunks:
+            f.write(cb)
+    finally:
+        f.close()
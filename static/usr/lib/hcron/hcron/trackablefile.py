@@ -92,6 +92,11 @@ class ConfigFile(TrackableFile):
 
 class AllowFile(TrackableFile):
 
+    def __init__(self, path):
+        self.added = []
+        self.removed = []
+        TrackableFile.__init__(self, path)
+
     def dump(self, path):
         try:
             f = None
@@ -120,8 +125,16 @@ class AllowFile(TrackableFile):
         except Exception:
                 log_message("error", "cannot load hcron.allow file (%s)." % self.path)
 
+        previous = set(self.contents or [])
         self.contents = list(set(allowedusers))
         self.mtime = mtime
+        self.added = sorted(set(self.contents)-previous)
+        self.removed = sorted(previous-set(self.contents))
+
+    def get_changes(self):
+        """Return (added, removed) usernames of the last load.
+        """
+        return self.added, self.removed
 
 class SignalDir(TrackableFile):
     def load(self):
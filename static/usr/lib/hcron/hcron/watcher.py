@@ -0,0 +1,151 @@
+#! /usr/bin/env python2
+#
+# hcron/watcher.py
+
+# GPL--start
+# This file is part of hcron
+# Copyright (C) 2008-2019 Environment/Environnement Canada
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+# GPL--end
+
+"""Watching of directories for changed files.
+
+inotify is used (through ctypes) where available. Otherwise, or if
+disabled (use_inotify), watchers fall back to polling: waiting
+simply times out and callers check for changes themselves.
+"""
+
+# system imports
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# app imports
+from hcron import globs
+from hcron.constants import *
+from hcron.logger import *
+
+# from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# file written (and closed) or moved into place
+IN_CHANGED = IN_CLOSE_WRITE|IN_MOVED_TO
+
+INOTIFY_EVENT_HEADER = "iIII"
+INOTIFY_EVENT_HEADER_SIZE = struct.calcsize(INOTIFY_EVENT_HEADER)
+
+class Inotify:
+    """Minimal inotify interface.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._inotify_add_watch.restype = ctypes.c_int
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.wds = {}
+
+    def add_watch(self, path, mask):
+        wd = self._inotify_add_watch(self.fd, path.encode("utf-8"), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, "%s (%s)" % (os.strerror(e), path))
+        self.wds[wd] = path
+        return wd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def read(self, timeout=None):
+        """Return list of (path, mask, name) for events, waiting up to
+        timeout seconds for some. path is that of the watch.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+
+        try:
+            b = os.read(self.fd, 65536)
+        except OSError as detail:
+            if detail.errno == errno.EAGAIN:
+                return []
+            raise
+
+        l = []
+        offset = 0
+        while offset+INOTIFY_EVENT_HEADER_SIZE <= len(b):
+            wd, mask, cookie, length = struct.unpack_from(INOTIFY_EVENT_HEADER, b, offset)
+            offset += INOTIFY_EVENT_HEADER_SIZE
+            name = b[offset:offset+length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += length
+            l.append((self.wds.get(wd), mask, name))
+        return l
+
+class Watcher:
+    """Watcher of files in directories.
+    """
+
+    def __init__(self, dirpaths, mask=IN_CHANGED):
+        self.dirpaths = dirpaths
+        self.inotify = None
+
+        if globs.config.get("use_inotify", CONFIG_USE_INOTIFY):
+            inotify = None
+            try:
+                inotify = Inotify()
+                for dirpath in dirpaths:
+                    inotify.add_watch(dirpath, mask)
+                self.inotify = inotify
+            except Exception as detail:
+                log_message("warning", "cannot watch (%s) with inotify (%s); polling." % (", ".join(dirpaths), detail))
+                if inotify:
+                    inotify.close()
+
+    def is_polling(self):
+        return self.inotify == None
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for changes and return list of
+        (dirpath, name) of changed files. An overflow of events is
+        reported as (None, None). When polling, simply wait out
+        timeout and return an empty list.
+        """
+        if self.inotify == None:
+            time.sleep(timeout)
+            return []
+
+        l = []
+        for dirpath, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                l.append((None, None))
+            else:
+                l.append((dirpath, name))
+        return l
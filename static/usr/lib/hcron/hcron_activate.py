@@ -34,6 +34,7 @@ import traceback
 # app imports
 from hcron.constants import *
 from hcron import globs
+from hcron.control import ControlException, ControlUnavailableException, request
 
 def print_usage():
     print("""\
@@ -68,6 +69,15 @@ def main(args):
         stderr.write("error: bad/missing argument\n")
         sys.exit(1)
 
+    try:
+        request("activate", eventname=eventname)
+        sys.exit(0)
+    except ControlUnavailableException:
+        pass
+    except ControlException as detail:
+        stderr.write("error: %s\n" % detail)
+        sys.exit(1)
+
     try:
         fd, path = tempfile.mkstemp(dir=HCRON_ONDEMAND_HOME)
         os.write(fd, str.encode("%s\n" % eventname))
@@ -202,7 +202,7 @@ def convert_to_crontab(crontabpath, dirpath, remoteshell):
             path = os.path.join(root, filename)
             event = Event("", "", autoload=False)
             event.load(path)
-            d = dict(event.assignments)
+            d = dict(event.get_assignments() or [])
 
             l.append("# %s" % path)
             st = "%(when_minute)s %(when_hour)s %(when_day)s %(when_month)s %(when_dow)s" % d
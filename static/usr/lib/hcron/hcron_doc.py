@@ -55,7 +55,7 @@ def collect_info(events):
     for name, ev in events.items():
         dd = d[name] = {}
         ddd = dd["fields"] ={}
-        for k, v in ev.assignments:
+        for k, v in ev.get_assignments() or []:
             if k.islower():
                 ddd[k] = v
         dd["lines_raw"] = ev.lines_raw[:]
@@ -38,6 +38,7 @@ import traceback
 # hcron imports
 from hcron.constants import *
 from hcron import globs
+from hcron.control import ControlUnavailableException, request
 from hcron.library import whoami
 
 def print_usage():
@@ -63,10 +64,13 @@ def print_eventnames(pattern, showthings):
         return
 
     try:
-        username = whoami()
-        usereventlistspath = "%s/%s" % (HCRON_EVENT_LISTS_DUMP_DIR, username)
+        try:
+            l = request("list")
+        except ControlUnavailableException:
+            username = whoami()
+            usereventlistspath = "%s/%s" % (HCRON_EVENT_LISTS_DUMP_DIR, username)
 
-        l = json.load(open(usereventlistspath, "r"))
+            l = json.load(open(usereventlistspath, "r"))
 
         eventinfo = {}
         for d in l:
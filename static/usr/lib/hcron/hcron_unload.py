@@ -64,7 +64,9 @@ def main(args):
     try:
         setup()
 
-        signal_reload(unload=True)
+        if signal_reload(unload=True):
+            print("Unload requested for servername (%s) on host/fqdn (%s)." % (globs.servername, globs.fqdn))
+            sys.exit(0)
         now = datetime.datetime.now()
         next_interval = (now+datetime.timedelta(seconds=60)).replace(second=0,microsecond=0)
         print("Unload signalled for servername (%s) on host/fqdn (%s) at next interval (%s; in %ss)." % (globs.servername, globs.fqdn, next_interval, (next_interval-now).seconds))
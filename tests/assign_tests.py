@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+#
+# assign_tests.py
+#
+# usage: assign_tests.py [<ncases>]
+#
+# Differential test of the compiled substitution (substitute) against
+# the reference engine (hcron_variable_substitution) over a fixed
+# corpus and ncases (default 200000) random values. Then, time both
+# engines over the fixed corpus.
+
+from __future__ import print_function
+
+# system imports
+import random
+import sys
+import time
+#
+from hcron.assign import hcron_variable_substitution, substitute
+
+VARINFO = {
+    "A": "a:b:c:d:e",
+    "B": "2",
+    "C": "-1",
+    "D": "x,y",
+    "E": "",
+    "F": "1:3",
+    "G": "b*",
+    "HCRON_EVENT_NAME": "/aa/bb/cc",
+    "HCRON_HOST_NAME": "host.example.com",
+    "P": "*",
+    "S": ".",
+    "SEMI": ";",
+}
+
+CORPUS = [
+    "",
+    "plain text",
+    "$A",
+    "#A",
+    "$Z",
+    "#Z",
+    "$A-suffix",
+    "pre $A post",
+    "$A$B",
+    "$A[0]",
+    "$A[-1]",
+    "$A[1:3]",
+    "$A[::2]",
+    "$A[::-1]",
+    "$A[0,2,-1]",
+    "$A[$B]",
+    "$A[$C]",
+    "$A[$F]",
+    "$A[x]",
+    "$A[]",
+    "$A[::0]",
+    "$A[1:3",
+    "#A[1:3]",
+    "$A[?,!1:3]",
+    "$A[:?-!1:3]",
+    "$A[$S?$SEMI!0,1]",
+    "$A[!0]",
+    "$A{b}",
+    "$A{b,d}",
+    "$A{$G}",
+    "$A{*}",
+    "#A{[a-c]}",
+    "$A{:?-!*}",
+    "$D[,!0]",
+    "$E[!0]",
+    "$E[0]",
+    "$Z[0]",
+    "$HCRON_EVENT_NAME[-1]",
+    "$HCRON_EVENT_NAME[1:]",
+    "#HCRON_EVENT_NAME",
+    "$HCRON_HOST_NAME[.!0]",
+    "$HCRON_HOST_NAME[$S!-2:]",
+    "$HCRON_HOST_NAME[$S?-!0,1]",
+    "$A[$A[$B]]",
+    "$A{$A[1]}",
+    "a $A[0] b $A[1] c $HCRON_EVENT_NAME[-1] d #A",
+]
+
+TOKENS = [
+    "$A", "#A", "$B", "$C", "$D", "$E", "$F", "$G", "$P", "$S", "$Z",
+    "$HCRON_EVENT_NAME", "#HCRON_EVENT_NAME", "$HCRON_HOST_NAME",
+    "[", "]", "{", "}", ":", "?", "!", ",", "-", "*", ".",
+    "0", "1", "2", "-1", "x", " ",
+]
+
+def random_value(rng):
+    return "".join([rng.choice(TOKENS) for _ in range(rng.randint(1, 10))])
+
+def check(values):
+    nfail = 0
+    for value in values:
+        expected = hcron_variable_substitution(value, VARINFO)
+        got = substitute(value, VARINFO)
+        if got != expected:
+            nfail += 1
+            if nfail <= 10:
+                print("FAIL: value (%r) expected (%r) got (%r)" % (value, expected, got))
+    return nfail
+
+if __name__ == "__main__":
+    ncases = len(sys.argv) > 1 and int(sys.argv[1]) or 200000
+    rng = random.Random(0)
+
+    print("differential tests:")
+    nfail = check(CORPUS)
+    print("%4s: corpus (%s values)" % (nfail and "FAIL" or "GOOD", len(CORPUS)))
+    nfail = check([random_value(rng) for _ in range(ncases)])
+    print("%4s: random (%s values)" % (nfail and "FAIL" or "GOOD", ncases))
+
+    print("benchmark (corpus x 1000):")
+    for name, fn in [("hcron_variable_substitution", hcron_variable_substitution), ("substitute", substitute)]:
+        t0 = time.time()
+        for _ in range(1000):
+            for value in CORPUS:
+                fn(value, VARINFO)
+        print("%s: elapsed (%f)" % (name, time.time()-t0))
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+#
+# event_memory_tests.py
+#
+# usage: event_memory_tests.py [<nevents>]
+#
+# Compare RSS of nevents (default 1000000) synthetic events held in
+# the former (instance __dict__, retained source lines) layout and
+# in the compact (__slots__, folded assignments only) Event layout.
+# Each layout is measured in its own process.
+
+from __future__ import print_function
+
+# system imports
+import os
+import subprocess
+import sys
+#
+from hcron.assign import fold_assignments
+from hcron.event import Event, is_late_name
+from hcron.library import list_st_to_bitmask, WHEN_BITMASKS, WHEN_MIN_MAX, WHEN_NAMES
+
+EVENT_TEMPLATE = """\
+as_user=
+host=host%(i)s
+command=/home/user/bin/job%(i)s --option value
+notify_email=
+notify_message=
+when_month=*
+when_day=*
+when_hour=%(hour)s
+when_minute=%(minute)s
+when_dow=1-5"""
+
+class LegacyEvent:
+    """Former Event layout (attributes only).
+    """
+
+    def __init__(self, name, username):
+        self.name = name
+        self.username = username
+        self.assignments = None
+        self.deleted = False
+        self.lines_raw = None
+        self.lines_included = None
+        self.masks = None
+        self.reason = None
+        self.type = None
+        self.when = None
+
+def get_rss():
+    """Return resident set size (bytes).
+    """
+    return int(open("/proc/self/statm").read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+
+def make_event(cls, i):
+    st = EVENT_TEMPLATE % {"i": i, "hour": i % 24, "minute": i % 60}
+    lines = st.split("\n")
+    assignments = [tuple(line.split("=", 1)) for line in lines]
+    d = dict(assignments)
+    masks = dict([(j, list_st_to_bitmask(d.get(name, "*"), WHEN_MIN_MAX[name], WHEN_BITMASKS[name])) \
+        for j, name in enumerate(WHEN_NAMES)])
+
+    username = "".join(["us", "er"])
+    if cls == LegacyEvent:
+        event = LegacyEvent("/job%s" % i, username)
+        event.lines_raw = lines[:]
+        event.lines_included = lines[:]
+        event.assignments = assignments
+        event.masks = masks
+    else:
+        event = Event("/job%s" % i, username, autoload=False)
+        event.folded_assignments = fold_assignments(assignments, {}, is_late_name)
+        event.masks = tuple([masks[j] for j in range(len(WHEN_NAMES))])
+    event.reason = "passed"
+    event.type = "normal"
+    event.when = "* %(when_month)s %(when_day)s %(when_hour)s %(when_minute)s %(when_dow)s" % d
+    return event
+
+def measure(layout, nevents):
+    cls = layout == "legacy" and LegacyEvent or Event
+    rss0 = get_rss()
+    events = [make_event(cls, i) for i in range(nevents)]
+    rss1 = get_rss()
+    print("%-8s nevents (%s) rss (%.1f MB) per event (%d B)" % \
+        (layout, nevents, (rss1-rss0)/2.0**20, (rss1-rss0)/nevents))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] in ["legacy", "compact"]:
+        measure(args[0], int(args[1]))
+    else:
+        nevents = args and args[0] or "1000000"
+        for layout in ["legacy", "compact"]:
+            subprocess.call([sys.executable, sys.argv[0], layout, nevents])
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+#
+# eventparser_tests.py
+#
+# usage: eventparser_tests.py [<ncases>]
+#
+# Differential test of the single pass parser (parse_contents)
+# against the former line processing (process_lines, process_includes,
+# load_assignments) over ncases (default 20000) random contents. Then,
+# time both on contents near max_event_file_size and on a chain of
+# nested includes.
+
+from __future__ import print_function
+
+# system imports
+import random
+import sys
+import time
+#
+from hcron.constants import CONFIG_MAX_EVENT_FILE_SIZE
+from hcron.eventparser import ParseException, parse_contents
+
+MAX_DEPTH = 3
+
+def process_lines(lines):
+    l = []
+    while lines:
+        line = lines.pop(0)
+        if line.lstrip().startswith("#"):
+            continue
+        while lines and line.endswith("\\"):
+            line = line[:-1]+lines.pop(0)
+
+        line = line.strip()
+        if line == "":
+            continue
+        l.append(line)
+
+    return l
+
+def process_includes(lines, includes, depth=1):
+    if depth > MAX_DEPTH:
+        raise Exception("Reached include depth maximum (%s)." % depth)
+
+    l = []
+    for line in lines:
+        t = line.split()
+        if len(t) == 2 and t[0] == "include":
+            lines2 = includes[t[1]].split("\n")
+            lines2 = process_lines(lines2)
+            lines2 = process_includes(lines2, includes, depth+1)
+            l.extend(lines2)
+        else:
+            l.append(line)
+
+    return l
+
+def load_assignments(lines):
+    l = []
+    for line in lines:
+        name, value  = line.split("=", 1)
+        l.append((name.strip(), value.strip()))
+
+    return l
+
+def old_parse(st, includes):
+    try:
+        lines = process_includes(process_lines(st.split("\n")), includes)
+        return load_assignments(lines), lines
+    except Exception:
+        return None
+
+def new_parse(st, includes):
+    def parse(name, st, depth):
+        if depth > MAX_DEPTH:
+            raise Exception("Reached include depth maximum (%s)." % depth)
+        return parse_contents(st, name, lambda include_name: parse(include_name, includes[include_name], depth+1))
+
+    try:
+        return parse("/event", st, 1)
+    except ParseException:
+        return None
+
+TOKENS = [
+    "\n", "\n", "\n", "\\", "\\\n", "#", " ", "\t", "=", "a", "b=1", "c = 2 ",
+    "include", "include i1", "include i2", "include nosuch",
+]
+
+def random_contents(rng):
+    return "".join([rng.choice(TOKENS) for _ in range(rng.randint(0, 20))])
+
+def make_event_contents(size):
+    l = []
+    n = 0
+    i = 0
+    while n < size:
+        if i % 7 == 0:
+            line = "# comment %s" % i
+        elif i % 5 == 0:
+            line = "name%s = a long value \\\n    continued %s" % (i, i)
+        else:
+            line = "name%s=value $HCRON_EVENT_NAME[-1] %s" % (i, i)
+        l.append(line)
+        n += len(line)+1
+        i += 1
+    return "\n".join(l)
+
+if __name__ == "__main__":
+    ncases = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    rng = random.Random(0)
+
+    print("differential tests:")
+    nfail = 0
+    for _ in range(ncases):
+        includes = {
+            "i1": random_contents(rng),
+            "i2": "x=1\ninclude i3\n",
+            "i3": "include i1\n" + random_contents(rng),
+        }
+        st = random_contents(rng)
+        expected = old_parse(st, includes)
+        got = new_parse(st, includes)
+        if got != None:
+            got = (got[0], got[1])
+        if got != expected:
+            nfail += 1
+            if nfail <= 10:
+                print("FAIL: contents (%r) includes (%r) expected (%r) got (%r)" % (st, includes, expected, got))
+    print("%4s: random (%s contents)" % (nfail and "FAIL" or "GOOD", ncases))
+
+    print("benchmarks (best of 5):")
+    st = make_event_contents(CONFIG_MAX_EVENT_FILE_SIZE)
+    st10 = make_event_contents(10*CONFIG_MAX_EVENT_FILE_SIZE)
+    chain = {
+        "i1": "include i2\n" + make_event_contents(2000),
+        "i2": make_event_contents(2000),
+    }
+    for label, st, includes in [
+            ("event file (%s bytes) x 1000" % len(st), st, {}),
+            ("event file (%s bytes) x 1000" % len(st10), st10, {}),
+            ("include chain (depth %s) x 1000" % MAX_DEPTH, "include i1\n" + make_event_contents(100), chain)]:
+        assert old_parse(st, includes) == new_parse(st, includes)
+        for name, fn in [("old", old_parse), ("new", new_parse)]:
+            elapsed = None
+            for _ in range(5):
+                t0 = time.time()
+                for _ in range(1000):
+                    fn(st, includes)
+                t1 = time.time()-t0
+                if elapsed == None or t1 < elapsed:
+                    elapsed = t1
+            print("%s: %s: elapsed (%f)" % (label, name, elapsed))
@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+#
+# maskarray_tests.py
+#
+# usage: maskarray_tests.py [<nevents>]
+#
+# Check MaskArray.test against Event.test and time matching of one
+# minute for nevents (default 1000000) events.
+
+from __future__ import print_function
+
+# system imports
+import datetime
+import random
+import sys
+import time
+#
+from hcron.event import Event
+from hcron.library import date_to_bitmasks, list_st_to_bitmask, WHEN_BITMASKS, WHEN_MIN_MAX, WHEN_NAMES
+from hcron import maskarray
+from hcron.maskarray import MaskArray
+
+def random_when(when_name):
+    mn, mx = WHEN_MIN_MAX[when_name]
+    r = random.random()
+    if r < 0.3:
+        st = "*"
+    elif r < 0.5:
+        st = "*/%s" % random.randint(2, 7)
+    elif r < 0.7:
+        low = random.randint(mn, mx)
+        st = "%s-%s" % (low, random.randint(low, mx))
+    else:
+        st = ",".join([str(random.randint(mn, mx)) for _ in range(random.randint(1, 3))])
+    return list_st_to_bitmask(st, WHEN_MIN_MAX[when_name], WHEN_BITMASKS[when_name])
+
+def make_events(nevents):
+    events = []
+    for i in range(nevents):
+        event = Event("/ev%s" % i, "user", autoload=False)
+        event.masks = tuple([random_when(when_name) for when_name in WHEN_NAMES])
+        event.type = "normal"
+        events.append(event)
+    return events
+
+def get_datemasks(dt):
+    # hcron: 0=sun - 6=sat; isoweekday: 1=mon = 7=sun
+    return date_to_bitmasks(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.isoweekday() % 7)
+
+if __name__ == "__main__":
+    nevents = len(sys.argv) > 1 and int(sys.argv[1]) or 1000000
+    random.seed(0)
+    start = datetime.datetime(2019, 12, 31, 22, 0)
+
+    print("equivalence tests:")
+    events = make_events(2000)
+    for use_numpy in [False, True]:
+        if use_numpy and maskarray.numpy == None:
+            print("SKIP: numpy not available")
+            continue
+        ma = MaskArray(events, use_numpy=use_numpy)
+        nfail = 0
+        for i in range(0, 60*24*3, 7):
+            datemasks = get_datemasks(start+datetime.timedelta(minutes=i))
+            expected = [event.name for event in events if event.test(datemasks)]
+            value = [event.name for event in ma.test(datemasks)]
+            if value != expected:
+                nfail += 1
+        print("%4s: use_numpy (%s)" % (nfail and "FAIL" or "GOOD", use_numpy))
+
+    print("benchmark (%s events):" % nevents)
+    events = make_events(nevents)
+    datemasks = get_datemasks(start)
+
+    t0 = time.time()
+    count = len([event for event in events if event.test(datemasks)])
+    print("Event.test: count (%s) elapsed (%f)" % (count, time.time()-t0))
+
+    for use_numpy in [False, True]:
+        if use_numpy and maskarray.numpy == None:
+            continue
+        t0 = time.time()
+        ma = MaskArray(events, use_numpy=use_numpy)
+        t1 = time.time()
+        count = len(ma.test(datemasks))
+        print("MaskArray.test: use_numpy (%s) count (%s) build (%f) elapsed (%f)" % (use_numpy, count, t1-t0, time.time()-t1))